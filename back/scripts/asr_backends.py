@@ -0,0 +1,148 @@
+import os
+import zlib
+import numpy as np
+from video_io import SAMPLE_RATE
+
+# 音声認識エンジンの切り替え
+# どのエンジンも transcribe(audio, prompt, language) -> 文字列 の形で呼び出せる
+# audio は16kHzモノラルfloat32の配列（video_io.load_audio の結果やそのスライス）
+ASR_BACKEND = os.environ.get("ASR_BACKEND", "mlx")  # mlx / faster-whisper / stub
+MIN_WINDOW_SECONDS = 1.0  # これより短い音声は無音扱い（パディングだらけの窓ではWhisperが幻覚を起こす）
+NO_SPEECH_THRESHOLD = 0.6  # 無音の確率がこれを超える窓の結果は捨てる（Whisperの既定値と同じ）
+COMPRESSION_RATIO_THRESHOLD = 2.4  # 同じ語の繰り返しなど、圧縮率がこれを超える結果は捨てる
+
+# 文字列の圧縮率（繰り返しが多いほど大きい）
+def compression_ratio(text):
+    data = text.encode("utf-8")
+    return len(data) / len(zlib.compress(data)) if data else 0.0
+
+
+# 共通部分：複数スライドの一括認識（バッチ非対応のエンジンは1件ずつ処理）
+class ASRBackend:
+    name = None
+
+    # audios[i] を prompts[i] をプロンプトとして認識し、同じ順番の文字列リストを返す
+    def transcribe_batch(self, audios, prompts, language="ja"):
+        return [self.transcribe(audio, prompt=prompt, language=language) for audio, prompt in zip(audios, prompts)]
+
+
+# Apple Silicon用（mlx-whisper）
+class MlxWhisperBackend(ASRBackend):
+    name = "mlx"
+
+    def __init__(self, model="mlx-community/whisper-large-v3-mlx", verbose=False):
+        from mlx_whisper import transcribe
+        self._transcribe = transcribe
+        self.model = model
+        self.verbose = verbose
+
+    def transcribe(self, audio, prompt="", language="ja"):
+        result = self._transcribe(
+            audio,
+            path_or_hf_repo=self.model,
+            language=language,
+            task="transcribe",
+            initial_prompt=prompt,
+            verbose=self.verbose,
+            condition_on_previous_text=False,
+            carry_initial_prompt=True
+        )
+        return result.get("text", "").strip()
+
+
+# CPU用（CTranslate2版 faster-whisper、int8量子化）
+class FasterWhisperBackend(ASRBackend):
+    name = "faster-whisper"
+
+    def __init__(self, model="large-v3", compute_type="int8", cpu_threads=0, beam_size=5, batch_size=8):
+        from faster_whisper import WhisperModel
+        self.model = WhisperModel(model, device="cpu", compute_type=compute_type, cpu_threads=cpu_threads)
+        self.beam_size = beam_size
+        self.batch_size = batch_size
+
+    def transcribe(self, audio, prompt="", language="ja"):
+        segments, _info = self.model.transcribe(
+            audio,
+            language=language,
+            task="transcribe",
+            beam_size=self.beam_size,
+            initial_prompt=prompt or None,
+            condition_on_previous_text=False
+        )
+        return "".join(seg.text for seg in segments).strip()
+
+    # スライドごとのプロンプトを保ったまま、複数スライドをまとめてエンコーダ・デコーダに通す
+    # 30秒を超えるスライドは30秒窓に分け、各窓に同じプロンプトを付ける（carry_initial_prompt相当）
+    def transcribe_batch(self, audios, prompts, language="ja"):
+        from faster_whisper.audio import pad_or_trim
+        from faster_whisper.tokenizer import Tokenizer
+
+        tokenizer = Tokenizer(self.model.hf_tokenizer, self.model.model.is_multilingual, task="transcribe", language=language)
+        window = self.model.feature_extractor.n_samples
+        max_length = 448
+
+        # (スライド番号, 30秒以内の音声, デコーダ入力トークン) の一覧を作る
+        # 30秒で機械的に切ると末尾に短い窓が残るので、必要な窓数で均等に分ける（30.2秒なら15.1秒×2）
+        windows = []
+        for idx, (audio, prompt) in enumerate(zip(audios, prompts)):
+            if len(audio) < MIN_WINDOW_SECONDS * SAMPLE_RATE:
+                continue
+            prefix = [tokenizer.sot_prev] + tokenizer.encode(" " + prompt.strip())[-(max_length // 2 - 1):] if prompt else []
+            tokens = prefix + list(tokenizer.sot_sequence) + [tokenizer.no_timestamps]
+            count = -(-len(audio) // window)
+            bounds = np.linspace(0, len(audio), count + 1).astype(int)
+            for start, end in zip(bounds[:-1], bounds[1:]):
+                windows.append((idx, audio[start:end], tokens))
+
+        texts = [[] for _ in audios]
+        for b in range(0, len(windows), self.batch_size):
+            batch = windows[b:b + self.batch_size]
+            # 長さの違う窓は30秒にパディングして1つのバッチにまとめる
+            features = np.stack([pad_or_trim(self.model.feature_extractor(chunk)) for _, chunk, _ in batch])
+            encoder_output = self.model.encode(features)
+            results = self.model.model.generate(
+                encoder_output,
+                [tokens for _, _, tokens in batch],
+                beam_size=self.beam_size,
+                max_length=max_length,
+                suppress_blank=True,
+                suppress_tokens=[-1],
+                return_no_speech_prob=True
+            )
+            # 結果をスライド番号に戻す（窓の順番は保たれている）
+            # transcribe() と同じく、無音らしい窓と繰り返しばかりの窓の結果は捨てる
+            for (idx, _, _), result in zip(batch, results):
+                ids = [t for t in result.sequences_ids[0] if t < tokenizer.eot]
+                text = tokenizer.decode(ids)
+                if result.no_speech_prob > NO_SPEECH_THRESHOLD or compression_ratio(text) > COMPRESSION_RATIO_THRESHOLD:
+                    continue
+                texts[idx].append(text)
+
+        return ["".join(parts).strip() for parts in texts]
+
+
+# テスト用：モデルを使わず、音声の内容から決まった文字列を返す
+class StubBackend(ASRBackend):
+    name = "stub"
+
+    def __init__(self, **_kwargs):
+        pass
+
+    def transcribe(self, audio, prompt="", language="ja"):
+        audio = np.asarray(audio, dtype=np.float32)
+        checksum = zlib.crc32(audio.tobytes())
+        return f"[stub {language}] {len(audio) / SAMPLE_RATE:.2f}s {checksum:08x} {prompt[:20]}".strip()
+
+
+BACKENDS = {
+    MlxWhisperBackend.name: MlxWhisperBackend,
+    FasterWhisperBackend.name: FasterWhisperBackend,
+    StubBackend.name: StubBackend,
+}
+
+# 名前からエンジンを生成（省略時は環境変数 ASR_BACKEND）
+def get_asr_backend(name=None, **kwargs):
+    name = name or ASR_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"未知のASRバックエンド: {name}（{', '.join(BACKENDS)} から選択）")
+    return BACKENDS[name](**kwargs)
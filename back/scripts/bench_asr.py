@@ -0,0 +1,38 @@
+import sys
+import time
+from video_io import load_audio, SAMPLE_RATE
+from asr_backends import get_asr_backend, BACKENDS
+
+# ベンチマーク：ASRバックエンドごとの処理時間と実時間比(RTF)を測る
+# RTF = 処理時間 / 音声長（1未満なら実時間より速い）
+# 使い方: python bench_asr.py <動画 or 音声ファイル> [バックエンド,...] [スライド長(秒)]
+media_path = sys.argv[1]
+backend_names = sys.argv[2].split(",") if len(sys.argv) > 2 else list(BACKENDS)
+SLIDE_SECONDS = float(sys.argv[3]) if len(sys.argv) > 3 else 60.0
+
+def main():
+    audio = load_audio(media_path)
+    total_seconds = len(audio) / SAMPLE_RATE
+    step = int(SLIDE_SECONDS * SAMPLE_RATE)
+    # 本番と同じく、スライド相当の長さに区切って順に認識させる
+    segments = [audio[i:i + step] for i in range(0, len(audio), step)]
+    print(f"音声長: {total_seconds:.1f} 秒  セグメント数: {len(segments)}")
+
+    for name in backend_names:
+        try:
+            load_start = time.perf_counter()
+            backend = get_asr_backend(name)
+            load_time = time.perf_counter() - load_start
+        except Exception as e:
+            print(f"{name:<15} 読み込み失敗: {e}")
+            continue
+
+        start = time.perf_counter()
+        chars = 0
+        for segment in segments:
+            chars += len(backend.transcribe(segment, prompt="", language="ja"))
+        elapsed = time.perf_counter() - start
+        print(f"{name:<15} ロード: {load_time:6.1f} 秒  認識: {elapsed:7.1f} 秒  RTF: {elapsed / total_seconds:.3f}  文字数: {chars}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import sys
+import time
+import numpy as np
+from embedding import EMBED_MODEL, load_local_encoder
+
+# ベンチマーク：埋め込みエンジンごとのロード時間・1件ずつのレイテンシ・まとめて埋め込むときのスループット
+# 使い方: python bench_embedding.py [エンジン,...=torch,onnx,onnx-int8] [文書数=512] [バッチサイズ=64]
+engines = sys.argv[1].split(",") if len(sys.argv) > 1 else ["torch", "onnx", "onnx-int8"]
+DOCS = int(sys.argv[2]) if len(sys.argv) > 2 else 512
+BATCH_SIZE = int(sys.argv[3]) if len(sys.argv) > 3 else 64
+QUERIES = 50
+
+# 文字起こし相当の長さの文と、検索クエリ相当の短い文
+SENTENCE = "今日は情報ネットワークの基礎としてTCPとUDPの違いについて説明します。"
+documents = [f"{i}番目のスライドです。" + SENTENCE * (1 + i % 6) for i in range(DOCS)]
+queries = [f"TCPとUDPの違い {i}" for i in range(QUERIES)]
+
+def main():
+    print(f"文書 {DOCS}件（バッチ {BATCH_SIZE}）  クエリ {QUERIES}件")
+    for engine in engines:
+        try:
+            start = time.perf_counter()
+            encoder = load_local_encoder(EMBED_MODEL, engine)
+            load_time = time.perf_counter() - start
+        except Exception as e:
+            print(f"{engine:<10} 読み込み失敗: {e}")
+            continue
+
+        encoder.encode(queries[:2])  # ウォームアップ
+        latencies = []
+        for q in queries:
+            start = time.perf_counter()
+            encoder.encode([q])
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        encoder.encode(documents, batch_size=BATCH_SIZE)
+        elapsed = time.perf_counter() - start
+        print(f"{engine:<10} ロード: {load_time:5.1f} 秒  クエリ p50 {np.percentile(latencies, 50):6.1f} ms  "
+              f"p95 {np.percentile(latencies, 95):6.1f} ms  文書: {DOCS / elapsed:7.1f} 件/秒")
+
+if __name__ == "__main__":
+    main()
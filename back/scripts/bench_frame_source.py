@@ -0,0 +1,75 @@
+import os
+import sys
+import io
+import time
+import tempfile
+import subprocess
+import numpy as np
+from PIL import Image
+from video_io import get_duration, iter_frames
+
+# ベンチマーク：1回デコード(iter_frames) と 従来のフレームごとのffmpeg起動 を比較
+# 速度に加えて、同じ時刻のフレームの中身が一致するか（平均絶対差が DIFF_TOLERANCE 以下か）も確認する
+# 使い方: python bench_frame_source.py [動画の長さ(秒)] [INTERVAL]
+SYNTH_SECONDS = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+INTERVAL = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+DIFF_TOLERANCE = 3.0  # グレースケール変換の違い程度の差は同じフレームとみなす
+
+# 合成テスト動画を作成（スライド風に数秒ごとに切り替わるテストパターン）
+def make_synthetic_video(output_path, seconds):
+    subprocess.run([
+        "ffmpeg", "-y", "-v", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size=1280x720:rate=30:duration={seconds}",
+        "-c:v", "libx264", "-pix_fmt", "yuv420p", "-g", "300",
+        output_path
+    ], check=True)
+
+# 従来方式：時刻ごとにffmpegを起動してPNGを1枚取り出す
+def iter_frames_by_seek(video_path, interval, duration):
+    for t in range(0, int(duration), interval):
+        result = subprocess.run(
+            ["ffmpeg", "-ss", str(t), "-i", video_path, "-frames:v", "1", "-f", "image2pipe", "-vcodec", "png", "pipe:1"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+        yield t, np.asarray(Image.open(io.BytesIO(result.stdout)).convert("L"))
+
+def run(name, frames):
+    start = time.perf_counter()
+    collected = dict(frames)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<10} フレーム数: {len(collected):5d}  時間: {elapsed:7.2f} 秒  ({len(collected) / elapsed:6.1f} fps)")
+    return collected, elapsed
+
+# 同じ時刻のフレーム同士の平均絶対差を比べ、一致しない時刻のリストを返す
+def compare_frames(seek_frames, pipe_frames):
+    mismatched = []
+    for t in sorted(set(seek_frames) | set(pipe_frames)):
+        if t not in seek_frames or t not in pipe_frames:
+            mismatched.append((t, None))
+            continue
+        diff = float(np.abs(seek_frames[t].astype(np.float32) - pipe_frames[t].astype(np.float32)).mean())
+        if diff > DIFF_TOLERANCE:
+            mismatched.append((t, diff))
+    return mismatched
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        video_path = os.path.join(tmp_dir, "synthetic.mp4")
+        print(f"[INFO] 合成動画作成中... ({SYNTH_SECONDS} 秒)")
+        make_synthetic_video(video_path, SYNTH_SECONDS)
+        duration = get_duration(video_path)
+
+        seek_frames, seek_time = run("per-seek", iter_frames_by_seek(video_path, INTERVAL, duration))
+        pipe_frames, pipe_time = run("single", iter_frames(video_path, INTERVAL, duration))
+        print(f"高速化: {seek_time / pipe_time:.1f} 倍")
+
+        mismatched = compare_frames(seek_frames, pipe_frames)
+        if mismatched:
+            for t, diff in mismatched:
+                print(f"[NG] t={t}: " + ("片方にしかありません" if diff is None else f"平均絶対差 {diff:.1f}"))
+            sys.exit(1)
+        print(f"OK: 全 {len(seek_frames)} フレームの中身が一致しました")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import os
+import sys
+import time
+import sqlite3
+import tempfile
+import qg_store
+
+# qg.sqlite3 への書き込み方式の比較（一時DBに Q&A を N 行挿入する）
+#   per-slide: 従来の save_qna と同じく、スライドごとに接続・CREATE・INSERT・コミット
+#   batched  : qg_store の共有接続（WAL）で executemany・動画1本で1トランザクション
+# 使い方: python bench_qg_store.py [行数=10000] [1スライドあたりの件数=5]
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+PER_SLIDE = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+# 従来の save_qna が作っていたテーブル（文字起こしを行ごとに持つ）
+LEGACY_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS qg (
+        qgid TEXT PRIMARY KEY,
+        videoId TEXT,
+        voice_chunk TEXT,
+        model TEXT,
+        explain TEXT,
+        question TEXT,
+        priority REAL,
+        course TEXT,
+        section TEXT,
+        chunk_index INTEGER,
+        createdat TEXT
+    )
+'''
+
+def make_slides():
+    qna = [{"question": f"質問{i}", "answer": f"解答{i}", "priority": i % 10} for i in range(PER_SLIDE)]
+    return [("文字起こし" * 50, qna, idx) for idx in range(ROWS // PER_SLIDE)]
+
+def per_slide(db_path, slides):
+    for voice, qna, idx in slides:
+        conn = sqlite3.connect(db_path, timeout=30)
+        conn.execute(LEGACY_SCHEMA)
+        rows = [row[:11] for row in qg_store.qna_rows("bench", "c", "1", voice, qna, idx, "m")]
+        for row in rows:
+            conn.execute("""
+                INSERT INTO qg (qgid, videoId, voice_chunk, model, explain, question, priority, course, section, chunk_index, createdat)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, row)
+        conn.commit()
+        conn.close()
+
+def batched(db_path, slides):
+    qg_store.connect(db_path)
+    batch = qg_store.QnaBatch()
+    for voice, qna, idx in slides:
+        batch.add(qg_store.qna_rows("bench", "c", "1", voice, qna, idx, "m"))
+    batch.commit()
+    qg_store.close()
+
+def main():
+    slides = make_slides()
+    print(f"{len(slides) * PER_SLIDE}行（{len(slides)}スライド × {PER_SLIDE}件）")
+    for name, fn in (("per-slide", per_slide), ("batched", batched)):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "qg.sqlite3")
+            start = time.perf_counter()
+            fn(db_path, slides)
+            elapsed = time.perf_counter() - start
+            count = sqlite3.connect(db_path).execute("SELECT COUNT(*) FROM qg").fetchone()[0]
+            print(f"{name:10s} {elapsed:7.3f}s  {count / elapsed:10.0f} 行/s  ({count}行)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import os
+import sys
+import time
+import random
+import tempfile
+import numpy as np
+from retrieval import Retriever, MODES, CHROMA_PATH
+from lexical_index import tokenize
+
+# ベンチマーク：検索モードごとのレイテンシと再現率（recall@k）
+# 登録済みのスライドからクエリを作り、そのスライドが上位k件に入るかを数える
+#   ocr  : スライドのOCRキーワードから数語（専門用語で探す場合）
+#   voice: 文字起こしの途中の一文（話した内容で探す場合）
+# 全文検索インデックスは一時ファイルに作り直すので、本番のインデックスには触れない
+# 使い方: python bench_retrieval.py [ChromaのDBディレクトリ=../src/chroma_db] [k=5] [クエリ数=100]
+chroma_path = sys.argv[1] if len(sys.argv) > 1 else CHROMA_PATH
+K = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+MAX_QUERIES = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+random.seed(0)
+
+def make_queries(ids, documents, metadatas):
+    queries = {"ocr": [], "voice": []}
+    for id_, doc, meta in zip(ids, documents, metadatas):
+        words = [w for w in dict.fromkeys(tokenize(meta.get("ocr", ""))) if len(w) >= 2]
+        if words:
+            queries["ocr"].append((" ".join(random.sample(words, min(3, len(words)))), id_))
+        sentences = [s for s in doc.replace("。", "。\n").split("\n") if len(s.strip()) >= 10]
+        if sentences:
+            queries["voice"].append((random.choice(sentences).strip(), id_))
+    return {name: random.sample(q, min(MAX_QUERIES, len(q))) for name, q in queries.items()}
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        retriever = Retriever(chroma_path, os.path.join(tmp, "lexical.sqlite3"))
+        data = retriever.collection.get(include=["documents", "metadatas"])
+        print(f"スライド {len(data['ids'])}件  recall@{K}")
+        query_sets = make_queries(data["ids"], data["documents"], data["metadatas"])
+
+        retriever.search("ウォームアップ", mode="hybrid")
+        for name, queries in query_sets.items():
+            print(f"[{name}] クエリ {len(queries)}件")
+            for mode in MODES:
+                hits = 0
+                latencies = []
+                for query, target in queries:
+                    start = time.perf_counter()
+                    results = retriever.search(query, mode=mode, n_results=K)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    hits += any(r["id"] == target for r in results)
+                print(f"  {mode:<8} recall {hits / max(len(queries), 1):6.1%}  "
+                      f"p50 {np.percentile(latencies, 50):6.1f} ms  p95 {np.percentile(latencies, 95):6.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+import os
+import sys
+import time
+from video_io import get_duration
+from process_video import detect_slide_boundaries
+
+# OCRの並列処理と直列処理でスライド境界が完全に一致するかを確認する
+# 使い方: python check_ocr_pool.py <動画ファイル> [並列数]
+def run(video_path, duration, ocr_workers):
+    start = time.perf_counter()
+    ocr_texts, boundaries = detect_slide_boundaries(video_path, duration, ocr_workers=ocr_workers)
+    print(f"workers={ocr_workers:<3d} 境界数: {len(boundaries)}  時間: {time.perf_counter() - start:.2f} 秒")
+    return ocr_texts, boundaries
+
+if __name__ == "__main__":
+    video_path = sys.argv[1]
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 2)
+
+    duration = get_duration(video_path)
+    serial = run(video_path, duration, 1)
+    parallel = run(video_path, duration, workers)
+
+    if serial != parallel:
+        print("NG: 直列と並列で結果が一致しません")
+        print("直列:", serial[1])
+        print("並列:", parallel[1])
+        sys.exit(1)
+    print("OK: 直列と並列で結果が一致しました")
@@ -0,0 +1,63 @@
+import os
+import sys
+import numpy as np
+from chromadb import PersistentClient
+from embedding import EMBED_MODEL, load_local_encoder, pairwise_cos_sim
+from process_video import SIM_THRESHOLD
+
+# ONNX（fp32 / int8）の埋め込みが元の SentenceTransformer(fp32) とどれだけ一致するかを確認する
+# 対象は Chroma に保存済みの文字起こしと、スライドのOCRキーワード
+#   - 文ごとのコサイン類似度（平均・最小）
+#   - 最近傍（自分以外で最も近い文書）が一致する割合
+#   - 隣り合うOCRキーワードの類似度が SIM_THRESHOLD をまたぐ判定（スライド境界）が一致する割合
+# 使い方: python check_onnx_embedding.py [エンジン,...=onnx-int8] [最小コサイン=0.98] [件数=500]
+engines = sys.argv[1].split(",") if len(sys.argv) > 1 else ["onnx-int8"]
+MIN_COSINE = float(sys.argv[2]) if len(sys.argv) > 2 else 0.98
+LIMIT = int(sys.argv[3]) if len(sys.argv) > 3 else 500
+CHROMA_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../src/chroma_db"))
+
+def normalize(x):
+    return x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+
+def nearest(x):
+    sims = normalize(x) @ normalize(x).T
+    np.fill_diagonal(sims, -np.inf)
+    return sims.argmax(axis=1)
+
+def main():
+    collection = PersistentClient(path=CHROMA_PATH).get_or_create_collection("video-transcripts")
+    data = collection.get(limit=LIMIT, include=["documents", "metadatas"])
+    documents = [d for d in data["documents"] if d]
+    keywords = [m.get("ocr", "") for m in data["metadatas"] if m.get("ocr")]
+    if len(documents) < 2:
+        print("Chromaに文字起こしがありません。先に動画を登録してください")
+        sys.exit(1)
+    print(f"文字起こし {len(documents)}件  OCRキーワード {len(keywords)}件")
+
+    reference = load_local_encoder(EMBED_MODEL, "torch")
+    ref_docs = reference.encode(documents)
+    ref_kw = reference.encode(keywords) if len(keywords) > 1 else None
+    ref_nearest = nearest(ref_docs)
+
+    ok = True
+    for engine in engines:
+        encoder = load_local_encoder(EMBED_MODEL, engine)
+        docs = encoder.encode(documents)
+        cos = pairwise_cos_sim(docs, ref_docs)
+        top1 = float(np.mean(nearest(docs) == ref_nearest))
+        line = f"{engine:<10} コサイン 平均 {cos.mean():.4f} 最小 {cos.min():.4f}  最近傍一致 {top1:.1%}"
+        if ref_kw is not None:
+            kw = encoder.encode(keywords)
+            same = (pairwise_cos_sim(kw[1:], kw[:-1]) < SIM_THRESHOLD) == (pairwise_cos_sim(ref_kw[1:], ref_kw[:-1]) < SIM_THRESHOLD)
+            line += f"  境界判定一致 {same.mean():.1%}"
+        print(line)
+        if cos.min() < MIN_COSINE:
+            print(f"NG: {engine} の最小コサインが {MIN_COSINE} を下回りました")
+            ok = False
+
+    if not ok:
+        sys.exit(1)
+    print("OK: すべてのエンジンが基準を満たしました")
+
+if __name__ == "__main__":
+    main()
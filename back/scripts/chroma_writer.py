@@ -0,0 +1,62 @@
+import numpy as np
+
+# Chromaへの書き込み：スライドを batch_size 件ずつ溜め、埋め込んでから upsert する
+# 同じIDは上書きされるので再実行しても重複せず、動画1本分の埋め込みを一度にメモリに持たない
+# finish() で、今回書かなかった同じ動画の古いスライドID（再処理でスライドが減った分など）を削除する
+# lexical（LexicalIndex）を渡すと、全文検索インデックスにも同じ内容を書き込み・削除する
+CHROMA_BATCH_SIZE = 64
+
+
+class ChromaWriter:
+    # embed: 文書のリスト → 埋め込み（ndarray）、progress: 書き込み済み件数を受け取る関数
+    def __init__(self, collection, video_id, embed, batch_size=CHROMA_BATCH_SIZE, progress=None, lexical=None):
+        self.collection = collection
+        self.lexical = lexical
+        self.video_id = video_id
+        self.embed = embed
+        self.batch_size = batch_size
+        self.progress = progress
+        self.pending = []  # (id, 文書, メタデータ, 埋め込み or None)
+        self.written = set()
+
+    # embedding を渡したときはそのまま使い、埋め込み直さない
+    def add(self, id_, document, metadata, embedding=None):
+        self.pending.append((id_, document, metadata, embedding))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        ids, documents, metadatas, embeddings = zip(*self.pending)
+        missing = [k for k, e in enumerate(embeddings) if e is None]
+        if missing:
+            computed = self.embed([documents[k] for k in missing])
+            embeddings = list(embeddings)
+            for k, e in zip(missing, computed):
+                embeddings[k] = e
+        self.collection.upsert(
+            ids=list(ids),
+            documents=list(documents),
+            metadatas=list(metadatas),
+            embeddings=np.asarray(embeddings, dtype=np.float32).tolist()
+        )
+        if self.lexical:
+            self.lexical.upsert(list(ids), list(documents), list(metadatas))
+        self.written.update(ids)
+        self.pending = []
+        if self.progress:
+            self.progress(len(self.written))
+
+    # 残りを書き込み、keep にも今回の書き込みにも含まれない同じ動画のIDを削除する（削除件数を返す）
+    # keep: 今回は書かなかったが残しておくID（音声認識に失敗して次回やり直すスライドなど）
+    def finish(self, keep=()):
+        self.flush()
+        keep = self.written | set(keep)
+        existing = self.collection.get(where={"video_id": self.video_id}, include=[])["ids"]
+        stale = [id_ for id_ in existing if id_ not in keep]
+        for i in range(0, len(stale), self.batch_size):
+            self.collection.delete(ids=stale[i:i + self.batch_size])
+        if self.lexical and stale:
+            self.lexical.delete(stale)
+        return len(stale)
@@ -0,0 +1,162 @@
+import sys
+import json
+import time
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+from embedding import EMBED_MODEL, EMBED_ENGINE, load_local_encoder
+
+# 埋め込みサービス（localhost HTTP）
+# モデルを常駐させ、同時に届いたリクエストをまとめて1回で埋め込む（動的バッチング）
+# 検索クエリ（"cache": true）の埋め込みは最近使ったものをLRUキャッシュに残す
+# 使い方: python embed_service.py [ポート=8765]（エンジンは環境変数 EMBED_ENGINE で選ぶ）
+#   POST /embed  {"texts": [...], "cache": false} → {"model": ..., "embeddings": [[...], ...]}
+#   GET  /health → {"model": ..., 統計}
+PORT = int(sys.argv[1]) if len(sys.argv) > 1 else 8765
+MAX_BATCH = 64  # 1回にまとめて埋め込む文の数の目安
+MAX_WAIT = 0.01  # 後続のリクエストを待つ最大秒数
+CACHE_SIZE = 4096  # クエリ埋め込みのキャッシュ件数
+
+
+# 届いたリクエストを MAX_WAIT 秒か MAX_BATCH 文まで溜めてから1回で埋め込む
+class Batcher:
+    def __init__(self, encoder, max_batch=MAX_BATCH, max_wait=MAX_WAIT):
+        self.encoder = encoder
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.requests = queue.Queue()
+        self.batches = 0
+        self.texts = 0
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def embed(self, texts):
+        future = Future()
+        self.requests.put((texts, future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            pending = [self.requests.get()]
+            count = len(pending[0][0])
+            deadline = time.monotonic() + self.max_wait
+            while count < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                pending.append(item)
+                count += len(item[0])
+
+            texts = [text for t, _ in pending for text in t]
+            try:
+                vectors = self.encoder.encode(texts, batch_size=self.max_batch)
+            except Exception as e:
+                for _, future in pending:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.texts += len(texts)
+            start = 0
+            for t, future in pending:
+                future.set_result(vectors[start:start + len(t)])
+                start += len(t)
+
+
+class LRUCache:
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            if key in self.items:
+                self.items.move_to_end(key)
+                self.hits += 1
+                return self.items[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+
+encoder = None
+batcher = None
+cache = LRUCache()
+
+# cache=True のときはキャッシュにない文だけをバッチに回す
+def embed(texts, use_cache):
+    if not use_cache:
+        return batcher.embed(texts)
+    vectors = [cache.get(text) for text in texts]
+    missing = [i for i, v in enumerate(vectors) if v is None]
+    if missing:
+        # 同じリクエスト内で重複した文は1回だけ埋め込む
+        unique = list(dict.fromkeys(texts[i] for i in missing))
+        computed = dict(zip(unique, batcher.embed(unique)))
+        for text, vector in computed.items():
+            cache.put(text, vector)
+        vectors = [computed[text] if v is None else v for text, v in zip(texts, vectors)]
+    return np.asarray(vectors)
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/health":
+            self.send_error(404)
+            return
+        self.send_json({
+            "model": encoder.model_name,
+            "engine": encoder.engine,
+            "batches": batcher.batches,
+            "texts": batcher.texts,
+            "cache_hits": cache.hits,
+            "cache_misses": cache.misses
+        })
+
+    def do_POST(self):
+        if self.path != "/embed":
+            self.send_error(404)
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            texts = body["texts"]
+            if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+                raise ValueError("texts は文字列のリストにしてください")
+        except (ValueError, KeyError) as e:
+            self.send_error(400, str(e))
+            return
+        vectors = embed(texts, bool(body.get("cache"))) if texts else np.zeros((0, 0))
+        self.send_json({"model": encoder.model_name, "embeddings": vectors.tolist()})
+
+    def send_json(self, obj):
+        data = json.dumps(obj).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == "__main__":
+    print(f"{EMBED_MODEL} ({EMBED_ENGINE}) を読み込み中...")
+    encoder = load_local_encoder(EMBED_MODEL, EMBED_ENGINE)
+    batcher = Batcher(encoder)
+    print(f"埋め込みサービス起動: http://127.0.0.1:{PORT}")
+    ThreadingHTTPServer(("127.0.0.1", PORT), Handler).serve_forever()
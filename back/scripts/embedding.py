@@ -0,0 +1,128 @@
+import os
+import json
+import numpy as np
+import requests
+
+# 文章の埋め込み
+# 埋め込みサービス（embed_service.py）が起動していればそれを使い、なければこのプロセスでモデルを読み込む
+EMBED_MODEL = "cl-nagoya/ruri-small"
+# 埋め込みエンジン: torch（SentenceTransformer） / onnx（ONNX Runtime fp32） / onnx-int8（動的int8量子化）
+# onnx系は先に python export_onnx.py で書き出しておく
+EMBED_ENGINE = os.environ.get("EMBED_ENGINE", "torch")
+ONNX_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../src/onnx"))
+EMBED_SERVICE_URL = os.environ.get("EMBED_SERVICE_URL", "http://127.0.0.1:8765")
+SERVICE_TIMEOUT = (1, 600)  # (接続, 応答) 秒。大量の文書を送ることもあるので応答は長めに待つ
+HEALTH_TIMEOUT = (1, 2)  # ヘルスチェックは短く待ち、応答しないサービスはすぐ使わないと判断する
+REQUEST_CHUNK = 256  # 1リクエストで送る文の最大数
+
+
+# このプロセスでモデルを読み込んで埋め込む
+class LocalEncoder:
+    engine = "torch"
+
+    def __init__(self, model=EMBED_MODEL):
+        from sentence_transformers import SentenceTransformer
+        self.model_name = model
+        self.model = SentenceTransformer(model, trust_remote_code=True)
+
+    def encode(self, texts, batch_size=32, cache=False):
+        return np.asarray(self.model.encode(list(texts), batch_size=batch_size), dtype=np.float32)
+
+
+# 書き出し先（onnx_dir/model.onnx と、プーリング方法などを記録した onnx_dir/meta.json）
+def onnx_dir(model, quantized):
+    return os.path.join(ONNX_ROOT, model.replace("/", "__") + ("-int8" if quantized else ""))
+
+# ONNX Runtime で埋め込む（トークナイズは元のモデルのトークナイザ、プーリングは SentenceTransformer と同じ方法）
+class OnnxEncoder:
+    def __init__(self, model=EMBED_MODEL, quantized=True, threads=0):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+        path = onnx_dir(model, quantized)
+        if not os.path.exists(os.path.join(path, "model.onnx")):
+            raise FileNotFoundError(f"{path} がありません。先に python export_onnx.py {model} を実行してください")
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.model_name = model
+        self.engine = "onnx-int8" if quantized else "onnx"
+        self.tokenizer = AutoTokenizer.from_pretrained(model, trust_remote_code=True)
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads  # 0 ならコア数に合わせる
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(os.path.join(path, "model.onnx"), options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def encode(self, texts, batch_size=32, cache=False):
+        texts = list(texts)
+        vectors = []
+        for i in range(0, len(texts), batch_size):
+            enc = self.tokenizer(texts[i:i + batch_size], padding=True, truncation=True,
+                                 max_length=self.meta["max_seq_length"], return_tensors="np")
+            hidden = self.session.run(None, {name: enc[name].astype(np.int64) for name in self.input_names})[0]
+            vectors.append(_pool(hidden, enc["attention_mask"], self.meta))
+        if not vectors:
+            return np.zeros((0, self.meta["dim"]), dtype=np.float32)
+        return np.concatenate(vectors).astype(np.float32)
+
+def _pool(hidden, attention_mask, meta):
+    mask = attention_mask[..., None].astype(hidden.dtype)
+    if meta["pooling"] == "cls":
+        pooled = hidden[:, 0]
+    elif meta["pooling"] == "max":
+        pooled = np.where(mask > 0, hidden, -1e9).max(axis=1)
+    else:
+        pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+    if meta.get("normalize"):
+        pooled = pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+    return pooled
+
+# エンジン名からローカルのエンコーダを作る
+def load_local_encoder(model=EMBED_MODEL, engine=EMBED_ENGINE):
+    if engine == "torch":
+        return LocalEncoder(model)
+    if engine in ("onnx", "onnx-int8"):
+        return OnnxEncoder(model, quantized=engine == "onnx-int8")
+    raise ValueError(f"未対応の埋め込みエンジン: {engine}（torch / onnx / onnx-int8）")
+
+
+# 埋め込みサービスに問い合わせて埋め込む（cache=True の文はサービス側のLRUキャッシュを使う。検索クエリ向け）
+class ServiceEncoder:
+    def __init__(self, model=EMBED_MODEL, url=EMBED_SERVICE_URL, engine=EMBED_ENGINE):
+        self.model_name = model
+        self.engine = engine
+        self.url = url
+        self.session = requests.Session()
+
+    def health(self):
+        res = self.session.get(f"{self.url}/health", timeout=HEALTH_TIMEOUT)
+        res.raise_for_status()
+        return res.json()
+
+    def encode(self, texts, batch_size=None, cache=False):
+        texts = list(texts)
+        vectors = []
+        for i in range(0, len(texts), REQUEST_CHUNK):
+            res = self.session.post(f"{self.url}/embed", json={"texts": texts[i:i + REQUEST_CHUNK], "cache": cache}, timeout=SERVICE_TIMEOUT)
+            res.raise_for_status()
+            vectors.extend(res.json()["embeddings"])
+        return np.asarray(vectors, dtype=np.float32)
+
+
+# 同じモデル・エンジンを載せたサービスが応答すればそれを、なければローカルのモデルを返す
+def get_encoder(model=EMBED_MODEL, engine=EMBED_ENGINE):
+    service = ServiceEncoder(model, engine=engine)
+    try:
+        info = service.health()
+        if info.get("model") == model and info.get("engine", "torch") == engine:
+            print(f"埋め込みサービスを使用: {service.url}")
+            return service
+        print(f"[WARN] 埋め込みサービスのモデル・エンジンが異なるため使用しません: {info.get('model')} ({info.get('engine')})")
+    except requests.RequestException:
+        pass
+    return load_local_encoder(model, engine)
+
+# 行ごとのコサイン類似度（a[i] と b[i]）
+def pairwise_cos_sim(a, b):
+    a = a / np.maximum(np.linalg.norm(a, axis=1, keepdims=True), 1e-12)
+    b = b / np.maximum(np.linalg.norm(b, axis=1, keepdims=True), 1e-12)
+    return np.einsum("ij,ij->i", a, b)
@@ -0,0 +1,74 @@
+import os
+import sys
+import json
+import torch
+from sentence_transformers import SentenceTransformer
+from onnxruntime.quantization import quantize_dynamic, QuantType
+from embedding import EMBED_MODEL, onnx_dir
+
+# 埋め込みモデルを ONNX に書き出し、重みを動的int8量子化したものも作る
+# 使い方: python export_onnx.py [モデル名=cl-nagoya/ruri-small]
+#   EMBED_ENGINE=onnx-int8（量子化） / onnx（fp32） で使う
+model_name = sys.argv[1] if len(sys.argv) > 1 else EMBED_MODEL
+OPSET = 17
+
+
+# トークナイザの出力を位置引数で受け取り、最終層の隠れ状態を返す
+class HiddenStates(torch.nn.Module):
+    def __init__(self, model, input_names):
+        super().__init__()
+        self.model = model
+        self.input_names = input_names
+
+    def forward(self, *inputs):
+        return self.model(**dict(zip(self.input_names, inputs))).last_hidden_state
+
+
+def main():
+    st = SentenceTransformer(model_name, trust_remote_code=True, device="cpu")
+    transformer = st[0].auto_model.eval()
+    sample = st.tokenizer(["講義のスライドの文字起こし", "テスト"], padding=True, return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+
+    # プーリング方法は SentenceTransformer の設定をそのまま記録する
+    pooling = next((m for m in st if type(m).__name__ == "Pooling"), None)
+    meta = {
+        "model": model_name,
+        "pooling": pooling.get_pooling_mode_str() if pooling else "mean",
+        "normalize": any(type(m).__name__ == "Normalize" for m in st),
+        "max_seq_length": st.max_seq_length,
+        "dim": st.get_sentence_embedding_dimension(),
+        "inputs": input_names
+    }
+
+    fp32_dir = onnx_dir(model_name, quantized=False)
+    int8_dir = onnx_dir(model_name, quantized=True)
+    os.makedirs(fp32_dir, exist_ok=True)
+    os.makedirs(int8_dir, exist_ok=True)
+    fp32_path = os.path.join(fp32_dir, "model.onnx")
+
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(
+            HiddenStates(transformer, input_names),
+            tuple(sample[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=OPSET
+        )
+    print(f"書き出し: {fp32_path} ({os.path.getsize(fp32_path) / 1e6:.1f} MB)")
+
+    int8_path = os.path.join(int8_dir, "model.onnx")
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    print(f"int8量子化: {int8_path} ({os.path.getsize(int8_path) / 1e6:.1f} MB)")
+
+    for path in (fp32_dir, int8_dir):
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+    print(f"プーリング: {meta['pooling']}  正規化: {meta['normalize']}  次元: {meta['dim']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import sys
+import json
+import time
+import random
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# 動作確認用の偽Ollamaサーバ（/api/generate のみ）
+# 指定した遅延のあと、固定のQ&A配列を返す。一定の確率で500エラーを返してリトライを確認できる
+# "stream": true のときは <think> ブロック・配列・後置きの文章を少しずつNDJSONで返す
+# 使い方: python fake_ollama.py [ポート] [遅延(秒)] [エラー率]
+#   OLLAMA_URL=http://localhost:11435/api/generate python generate_question.py
+PORT = int(sys.argv[1]) if len(sys.argv) > 1 else 11435
+LATENCY = float(sys.argv[2]) if len(sys.argv) > 2 else 2.0
+ERROR_RATE = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0
+
+def fake_answer(prompt):
+    return json.dumps([
+        {"question": f"テスト質問1（{len(prompt)}文字のプロンプト）", "answer": "テスト解答1", "priority": "5.0"},
+        {"question": "テスト質問2", "answer": "テスト解答2", "priority": "3.0"}
+    ], ensure_ascii=False)
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        if self.path != "/api/generate":
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        if random.random() < ERROR_RATE:
+            self.send_error(500, "fake error")
+            return
+        if body.get("stream", True):
+            self.stream_answer(body)
+            return
+
+        time.sleep(LATENCY * (0.5 + random.random()))
+
+        data = json.dumps({
+            "model": body.get("model"),
+            "response": fake_answer(body.get("prompt", "")),
+            "done": True
+        }, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def stream_answer(self, body):
+        text = "<think>スライドの内容を確認します。</think>\n" + fake_answer(body.get("prompt", "")) + "\n\n以上が生成した質問です。" * 5
+        pieces = [text[i:i + 8] for i in range(0, len(text), 8)]
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        sent = 0
+        try:
+            for piece in pieces:
+                time.sleep(LATENCY / len(pieces))
+                line = json.dumps({"model": body.get("model"), "response": piece, "done": False}, ensure_ascii=False)
+                self.wfile.write(line.encode("utf-8") + b"\n")
+                self.wfile.flush()
+                sent += 1
+            self.wfile.write(json.dumps({"model": body.get("model"), "response": "", "done": True}).encode("utf-8") + b"\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # クライアントが配列を受け取り終えて接続を切った
+            print(f"[fake-ollama] 途中で切断されました（{sent}/{len(pieces)} チャンク送信済み）")
+
+    def log_message(self, format, *args):
+        print(f"[fake-ollama] {self.address_string()} {format % args}")
+
+
+if __name__ == "__main__":
+    print(f"偽Ollamaサーバ起動: http://localhost:{PORT}/api/generate (遅延 {LATENCY}s, エラー率 {ERROR_RATE})")
+    ThreadingHTTPServer(("localhost", PORT), Handler).serve_forever()
@@ -1,23 +1,55 @@
 import os
 import re
-import sqlite3
-import requests
+import sys
 import json
+import hashlib
 from datetime import datetime
 from chromadb import PersistentClient
+from ollama_client import OllamaClient, generate_in_order, parse_json_array
+import generation_cache
+import qg_store
+from question_dedup import dedup_stored
 
 # 環境設定
 CHROMA_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../src/chroma_db"))
-DB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../src/qg.sqlite3"))
-OLLAMA_URL = "http://localhost:11434/api/generate"
 MODEL_NAME = "qwen3:32b"  # 使用するモデル名
+# 同時にOllamaへ投げるリクエスト数（Ollama側も OLLAMA_NUM_PARALLEL を同じ以上にしておく）
+CONCURRENCY = int(os.environ.get("QG_CONCURRENCY", 4))
+# 生成結果キャッシュを使わず必ずOllamaに問い合わせる（python generate_question.py --no-cache）
+NO_CACHE = "--no-cache" in sys.argv
+# 文字起こし・OCRが前回の生成から変わったスライドだけを再生成する（python generate_question.py --changed-only）
+CHANGED_ONLY = "--changed-only" in sys.argv
+# 保存後に似た質問をまとめて重複除去しない（python generate_question.py --no-dedup）
+NO_DEDUP = "--no-dedup" in sys.argv
+MAX_REPAIR_ROUNDS = 2  # 不正・欠落した項目だけを再生成させる回数の上限
+DEFAULT_ITEM_COUNT = 3  # 配列が1件も得られなかったときに再生成を頼む件数
+
+# 出力形式（Ollamaの format に渡すJSONスキーマ。生成時点でこの形に制約される）
+QNA_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "question": {"type": "string"},
+            "answer": {"type": "string"},
+            "priority": {"type": "number", "minimum": 0, "maximum": 10}
+        },
+        "required": ["question", "answer", "priority"]
+    }
+}
 
 # Chromaからセグメント単位で取得（スライド単位）
+# chunk_index が実行ごとに変わらないよう、スライドの開始時刻順に並べる
 def get_slide_segments(video_id):
     client = PersistentClient(path=CHROMA_PATH)
     collection = client.get_or_create_collection("video-transcripts")
     results = collection.get(where={"video_id": video_id})
-    return zip(results["documents"], results["metadatas"])
+    return sorted(zip(results["documents"], results["metadatas"]), key=lambda s: s[1].get("start", 0))
+
+# セグメントの内容の指紋（文字起こしとOCRキーワードが同じなら同じ値）
+def segment_fingerprint(voice, meta):
+    data = json.dumps({"voice": voice, "ocr": meta.get("ocr", "")}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
 
 # プロンプト作成（OCR結果も含める）
 def make_prompt(course, ocr, voice):
@@ -30,17 +62,50 @@ def make_prompt(course, ocr, voice):
 
 絶対にJSON形式のみで出力してください：
 
-すべての項目（question, answer, priority）は必ず "（ダブルクォーテーション）で囲ってください。
+question, answer は必ず "（ダブルクォーテーション）で囲った文字列、priority は数値にしてください。
 JSONパーサーでエラーが出ないよう、文字列内の改行や記号にも注意してください。
 
 出力形式---
 [
-  {{"question": "質問文1", "answer": "解答1", "priority": "重要度"}},
-  {{"question": "質問文2", "answer": "解答2", "priority": "重要度"}}
+  {{"question": "質問文1", "answer": "解答1", "priority": 重要度}},
+  {{"question": "質問文2", "answer": "解答2", "priority": 重要度}}
 ]
 
 """
 
+# 修正用プロンプト：不正だった項目の修正と、足りない件数の追加だけを頼む
+def make_repair_prompt(course, ocr, voice, invalid_items, missing):
+    parts = []
+    if invalid_items:
+        parts.append("次の項目は不完全です（questionやanswerが空、またはpriorityが0.0〜10.0の数値でない）。内容を保ったまま修正してください：\n"
+                     + json.dumps(invalid_items, ensure_ascii=False))
+    if missing:
+        parts.append(f"さらに、まだ出していない質問と解答を{missing}件追加してください。")
+    request = "\n".join(parts)
+    return f"""
+あなたは{course}の講師です。以下のスライドの文字起こし{voice}と、スライド上のキーワード{ocr}に基づく振り返りテストを作成しています。
+
+{request}
+
+修正・追加した項目だけを、JSON配列のみで出力してください：
+[
+  {{"question": "質問文", "answer": "解答", "priority": 重要度}}
+]
+"""
+
+# Q&A1件の検証（問題なければ None、問題があれば理由）
+def validate_item(item):
+    for field in ("question", "answer"):
+        if not isinstance(item.get(field), str) or not item[field].strip():
+            return f"{field}が空"
+    try:
+        priority = float(item.get("priority"))
+    except (TypeError, ValueError):
+        return "priorityが数値でない"
+    if not 0.0 <= priority <= 10.0:
+        return "priorityが範囲外"
+    return None
+
 #繰り返しパースに失敗するとき
 def save_failed_output(video_id, chunk_index, content):
     fail_dir = "failures"
@@ -60,59 +125,74 @@ def extract_json_array(text):
         print(f"JSON抽出・整形に失敗: {e}")
     return None
 
-# Ollama呼び出し
-def call_ollama(prompt):
-    res = requests.post(OLLAMA_URL, json={
-        "model": MODEL_NAME,
-        "prompt": prompt,
-        "stream": False
-    })
-    res.raise_for_status()
-    return res.json()["response"]
-
-# SQLiteに保存
-def save_qna(video_id, course, section, voice, qna_list, slide_index):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS qg (
-            qgid TEXT PRIMARY KEY,
-            videoId TEXT,
-            voice_chunk TEXT,
-            explain TEXT,
-            question TEXT,
-            priority REAL,
-            course TEXT,
-            section TEXT,
-            chunk_index INTEGER,
-            createdat TEXT
-        )
-    ''')
-
-    now = datetime.utcnow()
-    createdat = now.isoformat()
-
-    for i, item in enumerate(qna_list):
-        question = item.get("question", "").strip()
-        answer = item.get("answer", "").strip()
-        try:
-            priority = float(item.get("priority", 0.0))
-        except:
-            priority = 0.0
+# Ollama呼び出し（接続を使い回すため共通のクライアントを使う）
+ollama = OllamaClient(MODEL_NAME, pool_size=CONCURRENCY)
 
-        if not question or not answer:
-            continue
+# Q&Aを保存用の行にする（保存は動画1本分をまとめて main で行う）
+def qna_rows(video_id, course, section, voice, qna_list, slide_index):
+    return qg_store.qna_rows(video_id, course, section, voice, qna_list, slide_index, MODEL_NAME)
 
-        qgid = now.strftime("%Y%m%d%H%M%S") + f"{slide_index:02d}{i:02d}"
-        cur.execute("""
-            INSERT INTO qg (qgid, videoId, voice_chunk, explain, question, priority, course, section, chunk_index, createdat)
+# 生成の統計を記録（パース失敗率と、修正のために使ったトークン数）
+def save_metrics(video_id, metrics):
+    slides = metrics["slides"]
+    rate = metrics["failed_slides"] / slides if slides else 0.0
+    with qg_store.transaction() as conn:
+        conn.execute("""
+            INSERT INTO qg_metrics (videoId, model, slides, failed_slides, parse_failure_rate, invalid_items, repair_requests, tokens, retried_tokens, createdat)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (qgid, video_id, voice, answer, question, priority, course, section, slide_index, createdat))
+        """, (video_id, MODEL_NAME, slides, metrics["failed_slides"], rate, metrics["invalid_items"],
+              metrics["repair_requests"], metrics["tokens"], metrics["retried_tokens"], datetime.utcnow().isoformat()))
+    print(f"パース失敗率: {rate:.1%}（{metrics['failed_slides']}/{slides}スライド）  "
+          f"修正リクエスト: {metrics['repair_requests']}回  修正に使ったトークン: {metrics['retried_tokens']}/{metrics['tokens'] + metrics['retried_tokens']}")
+
+# 1スライド分の生成：ストリーミングで受け取り、Q&Aが1件閉じるたびに検証して溜めていく
+# 不正・欠落した項目があれば、その分だけを修正プロンプトで再生成させる
+# 戻り値は (検証済みのQ&A, 最後の応答全文, 統計)
+def generate_for_slide(video_id, course, section, idx, voice, meta):
+    ocr = meta.get("ocr", "")
+    prompt = make_prompt(course, ocr, voice)
+    saved = []
+    invalid = []
+    stats = {"tokens": 0, "retried_tokens": 0, "invalid_items": 0, "repair_requests": 0, "failed": False}
+
+    def on_item(item):
+        if validate_item(item):
+            invalid.append(item)
+            return
+        saved.append(item)
+
+    # 同じモデル・オプション・スキーマ・プロンプトで生成済みならOllamaに投げずにキャッシュを使う
+    key = generation_cache.cache_key(MODEL_NAME, {"options": ollama.options, "format": QNA_SCHEMA}, prompt)
+    cached = None if NO_CACHE else generation_cache.get(key)
+    if cached is not None:
+        print(f"[{idx+1}] キャッシュを使用")
+        for item in parse_json_array(cached):
+            on_item(item)
+        return saved, cached, stats
+
+    items, response, complete, s = ollama.generate_json_array(prompt, on_item=on_item, format=QNA_SCHEMA)
+    stats["tokens"] += s["tokens"]
+    missing = s["failed"]
+    if not complete and not items:
+        missing = max(missing, DEFAULT_ITEM_COUNT)
+    stats["failed"] = bool(invalid or missing)
+
+    for _ in range(MAX_REPAIR_ROUNDS):
+        if not invalid and not missing:
+            break
+        stats["invalid_items"] += len(invalid)
+        stats["repair_requests"] += 1
+        expected = len(invalid) + missing
+        repair_prompt = make_repair_prompt(course, ocr, voice, invalid, missing)
+        invalid.clear()
+        items, response, complete, s = ollama.generate_json_array(repair_prompt, on_item=on_item, format=QNA_SCHEMA)
+        stats["retried_tokens"] += s["tokens"]
+        missing = max(0, expected - len(items))
 
-    conn.commit()
-    conn.close()
-    print(f"{len(qna_list)}件のQ&Aを保存しました。")
+    # キャッシュには検証済みの最終結果だけを入れる
+    if saved:
+        generation_cache.put(key, MODEL_NAME, json.dumps(saved, ensure_ascii=False))
+    return saved, response, stats
 
 # メイン処理
 def main():
@@ -125,18 +205,76 @@ def main():
         print("Chromaに該当するセグメントが見つかりません")
         return
 
-    for idx, (voice, meta) in enumerate(slides):
-        ocr = meta.get("ocr", "")
-        prompt = make_prompt(course, ocr, voice)
-        print(f"[{idx+1}/{len(slides)}] Q&A生成中...")
+    removed = generation_cache.evict()
+    if removed:
+        print(f"古い生成キャッシュを {removed}件 削除しました")
 
+    # 保存済みの質問を指紋（内容）で今のセグメントに対応づける
+    # スライドの挿入・削除で位置がずれただけのセグメントは付け替えて使い回し、なくなった位置の質問は削除する
+    # 同じ位置で内容が変わったスライドの質問は、再生成に成功するまで残しておく
+    fingerprints = [segment_fingerprint(voice, meta) for voice, meta in slides]
+    moved, removed = qg_store.match_chunks(video_id, fingerprints)
+    removed += qg_store.remove_chunks(video_id, range(len(slides)))
+    if moved:
+        print(f"位置が変わったスライドの質問を {moved}スライド分 付け替えました")
+    if removed:
+        print(f"削除されたスライドの質問を {removed}件 削除しました")
+
+    targets = list(range(len(slides)))
+    if CHANGED_ONLY:
+        stored = qg_store.get_fingerprints(video_id)
+        targets = [idx for idx in targets if stored.get(idx) != fingerprints[idx]]
+        print(f"内容が変わったスライド: {len(targets)}/{len(slides)}")
+        if not targets:
+            qg_store.close()
+            return
+
+    # 最大 CONCURRENCY 件を並行して生成し、結果の確認はスライド順に行う
+    print(f"{len(targets)}スライドのQ&A生成中...（並行数 {CONCURRENCY}）")
+
+    def generate_slide(idx):
+        voice, meta = slides[idx]
+        return generate_for_slide(video_id, course, section, idx, voice, meta)
+
+    # 生成できたスライドは以前の質問を置き換えて指紋を更新する（失敗したスライドは前回のまま残し、次回再生成する）
+    batch = qg_store.QnaBatch(video_id)
+    metrics = {"slides": len(targets), "failed_slides": 0, "invalid_items": 0, "repair_requests": 0, "tokens": 0, "retried_tokens": 0}
+    for pos, future in generate_in_order(generate_slide, targets, CONCURRENCY):
+        idx = targets[pos]
+        voice, meta = slides[idx]
+        print(f"[{idx+1}/{len(slides)}] Q&A生成完了待ち...")
+
+        response = None
+        stats = None
         try:
-            response = call_ollama(prompt)
-            qna_list = json.loads(response)
-            save_qna(video_id, course, section, voice, qna_list, idx)
+            saved, response, stats = future.result()
+            metrics["failed_slides"] += int(stats["failed"])
+            for name in ("invalid_items", "repair_requests", "tokens", "retried_tokens"):
+                metrics[name] += stats[name]
+            if saved:
+                batch.add(qna_rows(video_id, course, section, voice, saved, idx), idx, fingerprints[idx])
+                print(f"[{idx+1}] {len(saved)}件のQ&Aを生成しました。")
+                continue
+            # 1件も取り出せなかったときだけ、全文から配列を探し直す（ここでも検証を通ったものだけを使う）
+            qna_list = [item for item in extract_json_array(response or "") or []
+                        if isinstance(item, dict) and not validate_item(item)]
+            if not qna_list:
+                raise ValueError("有効なQ&Aを抽出できませんでした")
+            batch.add(qna_rows(video_id, course, section, voice, qna_list, idx), idx, fingerprints[idx])
+            print(f"[{idx+1}] {len(qna_list)}件のQ&Aを応答全文から取り出しました。")
         except Exception as e:
             print(f"[{idx+1}] 生成エラー: {e}")
-            print("Ollama応答:", response[:5000] if 'response' in locals() else "(取得不可)")
+            if stats is None or not stats["failed"]:
+                metrics["failed_slides"] += 1
+            save_failed_output(video_id, idx, response if response else "(取得不可)")
+
+    # 動画1本分を1トランザクションで保存する
+    print(f"{batch.commit()}件のQ&Aを保存しました。")
+    # 隣り合うスライドで内容が重なると似た質問が並ぶので、priority の高いものだけを残す
+    if not NO_DEDUP:
+        print(f"重複した質問を {dedup_stored(video_id=video_id)}件 削除しました。")
+    save_metrics(video_id, metrics)
+    qg_store.close()
 
 if __name__ == "__main__":
     main()
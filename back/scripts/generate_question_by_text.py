@@ -1,16 +1,18 @@
 import os
 import re
-import sqlite3
 import requests
 import json
-from datetime import datetime
 from chromadb import PersistentClient
+import qg_store
+from text_chunker import load_token_counter, chunk_budget, chunk_segments
 
 # 環境設定
 CHROMA_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../src/chroma_db"))
-DB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../src/qg.sqlite3"))
 OLLAMA_URL = "http://localhost:11434/api/generate"
 MODEL_NAME = "qwen3:32b"  # 使用するモデル名
+CONTEXT_WINDOW = 32768  # Ollamaに渡す num_ctx（モデルのコンテキスト長）
+MAX_OUTPUT_TOKENS = 4096  # 生成に残しておくトークン数
+OVERLAP_TOKENS = 512  # 隣り合うチャンクで重ねるトークン数
 
 # text 入手
 def load_voice_text():
@@ -18,6 +20,15 @@ def load_voice_text():
     with open(path, "r", encoding="utf-8") as f:
         return f.read().strip()
 
+# 「[開始 - 終了] 本文」の行ごとにセグメントとして取り出す
+def split_timestamped_segments(text):
+    segments = []
+    for line in text.splitlines():
+        line = re.sub(r"^\[[\d.]+\s*-\s*[\d.]+\]\s*", "", line).strip()
+        if line:
+            segments.append(line)
+    return segments
+
 # Chromaからセグメント単位で取得（スライド単位）
 def get_slide_segments(video_id):
     client = PersistentClient(path=CHROMA_PATH)
@@ -57,53 +68,15 @@ def call_ollama(prompt):
     res = requests.post(OLLAMA_URL, json={
         "model": MODEL_NAME,
         "prompt": prompt,
-        "stream": False
+        "stream": False,
+        "options": {"num_ctx": CONTEXT_WINDOW}  # 既定のコンテキスト長だと長いプロンプトが切り詰められる
     })
     res.raise_for_status()
     return res.json()["response"]
 
 # SQLiteに保存
 def save_qna(video_id, course, section, voice, qna_list, slide_index):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS qg (
-            qgid TEXT PRIMARY KEY,
-            videoId TEXT,
-            voice_chunk TEXT,
-            explain TEXT,
-            question TEXT,
-            priority REAL,
-            course TEXT,
-            section TEXT,
-            chunk_index INTEGER,
-            createdat TEXT
-        )
-    ''')
-
-    now = datetime.utcnow()
-    createdat = now.isoformat()
-
-    for i, item in enumerate(qna_list):
-        question = item.get("question", "").strip()
-        answer = item.get("answer", "").strip()
-        try:
-            priority = float(item.get("priority", 0.0))
-        except:
-            priority = 0.0
-
-        if not question or not answer:
-            continue
-
-        qgid = now.strftime("%Y%m%d%H%M%S") + f"{slide_index:02d}{i:02d}"
-        cur.execute("""
-            INSERT INTO qg (qgid, videoId, voice_chunk, explain, question, priority, course, section, chunk_index, createdat)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (qgid, video_id, voice, answer, question, priority, course, section, slide_index, createdat))
-
-    conn.commit()
-    conn.close()
+    qg_store.insert_qna_rows(qg_store.qna_rows(video_id, course, section, voice, qna_list, slide_index, MODEL_NAME))
     print(f"{len(qna_list)}件のQ&Aを保存しました。")
 
 # メイン処理
@@ -140,16 +113,24 @@ def main():
         print("音声テキストが読み込めませんでした")
         return
 
-    prompt = make_prompt(course, ocr="", voice=voice)
-    print("Q&A生成中...")
+    # コンテキスト長に収まるよう、文字起こしをトークン数で分割する
+    count_tokens = load_token_counter(MODEL_NAME)
+    budget = chunk_budget(CONTEXT_WINDOW, count_tokens(make_prompt(course, ocr="", voice="")), MAX_OUTPUT_TOKENS)
+    chunks = chunk_segments(split_timestamped_segments(voice), count_tokens, budget, OVERLAP_TOKENS)
+    print(f"チャンク数: {len(chunks)}（1チャンク最大 {budget} トークン）")
 
-    try:
-        response = call_ollama(prompt)
-        qna_list = json.loads(response)
-        save_qna(video_id, course, section, voice, qna_list, slide_index=0)
-    except Exception as e:
-        print(f"生成エラー: {e}")
-        save_failed_output(video_id, 0, response if 'response' in locals() else "(取得不可)")
+    for idx, chunk in enumerate(chunks):
+        prompt = make_prompt(course, ocr="", voice=chunk)
+        print(f"[{idx+1}/{len(chunks)}] Q&A生成中...")
+
+        response = None
+        try:
+            response = call_ollama(prompt)
+            qna_list = json.loads(response)
+            save_qna(video_id, course, section, chunk, qna_list, slide_index=idx)
+        except Exception as e:
+            print(f"[{idx+1}] 生成エラー: {e}")
+            save_failed_output(video_id, idx, response if response else "(取得不可)")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,62 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+
+# LLM生成結果のキャッシュ（SQLite）
+# キーは (モデル名, オプション, 展開済みプロンプト) のハッシュなので、文字起こしやOCRが変わったスライドだけが再生成される
+CACHE_DB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../src/qg_cache.sqlite3"))
+MAX_AGE_DAYS = float(os.environ.get("QG_CACHE_MAX_AGE_DAYS", 30))  # これより古いものは削除
+MAX_ENTRIES = int(os.environ.get("QG_CACHE_MAX_ENTRIES", 10000))  # これを超えたら使われていない順に削除
+
+def cache_key(model, options, prompt):
+    data = json.dumps({"model": model, "options": options or {}, "prompt": prompt}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+def connect():
+    conn = sqlite3.connect(CACHE_DB_PATH, timeout=30)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS generation_cache (
+            key TEXT PRIMARY KEY,
+            model TEXT,
+            response TEXT,
+            createdat REAL,
+            last_used REAL
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_generation_cache_last_used ON generation_cache (last_used)")
+    return conn
+
+# キャッシュ済みの応答（なければ None）
+def get(key):
+    conn = connect()
+    row = conn.execute("SELECT response FROM generation_cache WHERE key = ?", (key,)).fetchone()
+    if row:
+        conn.execute("UPDATE generation_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+        conn.commit()
+    conn.close()
+    return row[0] if row else None
+
+def put(key, model, response):
+    now = time.time()
+    conn = connect()
+    conn.execute("""
+        INSERT OR REPLACE INTO generation_cache (key, model, response, createdat, last_used)
+        VALUES (?, ?, ?, ?, ?)
+    """, (key, model, response, now, now))
+    conn.commit()
+    conn.close()
+
+# 古いもの・件数超過分を削除し、削除件数を返す
+def evict(max_age_days=MAX_AGE_DAYS, max_entries=MAX_ENTRIES):
+    conn = connect()
+    removed = conn.execute("DELETE FROM generation_cache WHERE createdat < ?", (time.time() - max_age_days * 86400,)).rowcount
+    removed += conn.execute("""
+        DELETE FROM generation_cache WHERE key IN (
+            SELECT key FROM generation_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+        )
+    """, (max_entries,)).rowcount
+    conn.commit()
+    conn.close()
+    return removed
@@ -0,0 +1,100 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+# 取り込み処理の段階ごとのキャッシュ（途中で落ちても再実行時に続きから処理する）
+# src/ingest_cache/<動画の内容ハッシュ>/<段階名>-<パラメータのハッシュ>.{json,jsonl,npy}
+CACHE_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../src/ingest_cache"))
+
+# ファイル内容のSHA-256（大きな動画でもメモリに載せず少しずつ読む）
+def file_sha256(path, chunk_size=1024 * 1024):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+# パラメータ（JSONにできる値）から短いハッシュを作る
+def params_hash(params):
+    data = json.dumps(params, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()[:16]
+
+
+class StageCache:
+    # video_hash が None のときは何も保存しない（キャッシュ無効）
+    def __init__(self, video_hash, root=CACHE_ROOT):
+        self.dir = os.path.join(root, video_hash) if video_hash else None
+        if self.dir:
+            os.makedirs(self.dir, exist_ok=True)
+
+    @classmethod
+    def disabled(cls):
+        return cls(None)
+
+    # 段階名とパラメータからキーを作る
+    # 上流段階のキーをパラメータに含めれば、上流が変わったとき下流もすべて作り直される
+    def key(self, stage, params):
+        return f"{stage}-{params_hash(params)}"
+
+    def _path(self, key, ext):
+        return os.path.join(self.dir, f"{key}.{ext}")
+
+    # 一時ファイルに書いてから置き換える（書き込み途中で落ちても壊れたキャッシュを残さない）
+    def _replace(self, path, write):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
+
+    # 完了済みの段階の結果（なければ None）
+    def load(self, key):
+        if not self.dir or not os.path.exists(self._path(key, "json")):
+            return None
+        with open(self._path(key, "json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save(self, key, value):
+        if not self.dir:
+            return
+        data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        self._replace(self._path(key, "json"), lambda f: f.write(data))
+        # 完了したので途中経過のログは不要
+        if os.path.exists(self._path(key, "jsonl")):
+            os.remove(self._path(key, "jsonl"))
+
+    def load_array(self, key):
+        if not self.dir or not os.path.exists(self._path(key, "npy")):
+            return None
+        return np.load(self._path(key, "npy"))
+
+    def save_array(self, key, array):
+        if not self.dir:
+            return
+        self._replace(self._path(key, "npy"), lambda f: np.save(f, np.asarray(array)))
+
+    # 段階の途中経過（1件1行のJSONL）。書きかけの行があればそこから後ろを切り捨てる
+    def load_records(self, key):
+        if not self.dir or not os.path.exists(self._path(key, "jsonl")):
+            return []
+        records = []
+        valid = 0
+        with open(self._path(key, "jsonl"), "r+b") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    records.append(json.loads(line.decode("utf-8")))
+                except (UnicodeDecodeError, json.JSONDecodeError):
+                    break
+                valid += len(line)
+            f.truncate(valid)
+        return records
+
+    def append_record(self, key, record):
+        if not self.dir:
+            return
+        with open(self._path(key, "jsonl"), "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
@@ -0,0 +1,63 @@
+import os
+import sys
+import time
+import socket
+import traceback
+import multiprocessing as mp
+import job_queue
+
+# 動画取り込みワーカー（常駐）
+# 各ワーカープロセスはWhisper・ruri-smallを1回だけ読み込み、ジョブ間で使い回す
+# 使い方: python ingest_worker.py [ワーカー数]
+INGEST_WORKERS = int(sys.argv[1]) if len(sys.argv) > 1 else int(os.environ.get("INGEST_WORKERS", 2))
+POLL_INTERVAL = 2.0  # 待ち行列が空のときの確認間隔（秒）
+
+def worker_loop(worker_name, ocr_workers):
+    # OCRの並列数はワーカー数で割って、CPUを取り合わないようにする
+    os.environ["OCR_WORKERS"] = str(ocr_workers)
+    import process_video
+
+    while True:
+        job = job_queue.claim_next(worker_name)
+        if job is None:
+            time.sleep(POLL_INTERVAL)
+            continue
+
+        job_id = job["id"]
+        print(f"[INFO] {worker_name}: ジョブ {job_id} 開始 (video_id={job['video_id']})")
+
+        def progress(stage, done=0, total=0):
+            job_queue.update_progress(job_id, stage, done, total)
+
+        try:
+            message = process_video.ingest_video(
+                job["video_path"], job["video_name"], job["course"], job["section"], job["video_id"],
+                progress=progress
+            )
+            job_queue.finish(job_id, message)
+            # 成功したらアップロードされた動画は不要（失敗時は再実行できるよう残す）
+            if os.path.exists(job["video_path"]):
+                os.remove(job["video_path"])
+            print(f"[INFO] {worker_name}: ジョブ {job_id} 完了")
+        except Exception as e:
+            traceback.print_exc()
+            job_queue.fail(job_id, f"{type(e).__name__}: {e}")
+
+def main():
+    requeued = job_queue.requeue_running()
+    if requeued:
+        print(f"[INFO] 中断されていたジョブ {requeued}件 を再開します")
+
+    ocr_workers = max(1, (os.cpu_count() or 1) // INGEST_WORKERS)
+    host = socket.gethostname()
+    procs = [
+        mp.Process(target=worker_loop, args=(f"{host}-{i}", ocr_workers))
+        for i in range(INGEST_WORKERS)
+    ]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import os
+import sys
+import json
+import uuid
+import sqlite3
+from datetime import datetime
+
+# 動画取り込みジョブのキュー（SQLite）
+# Nodeサーバは enqueue / status をこのスクリプト経由で呼び、ingest_worker.py のワーカーが順に処理する
+JOBS_DB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../src/jobs.sqlite3"))
+
+def connect():
+    conn = sqlite3.connect(JOBS_DB_PATH, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")  # ワーカーが書き込み中でも状態を読めるようにする
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            status TEXT,
+            video_path TEXT,
+            video_name TEXT,
+            course TEXT,
+            section TEXT,
+            video_id TEXT,
+            stage TEXT,
+            done INTEGER,
+            total INTEGER,
+            message TEXT,
+            worker TEXT,
+            createdat TEXT,
+            updatedat TEXT
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, createdat)")
+    # Chromaへの保存まで完了した動画（途中で落ちた取り込みの一部だけの結果を登録済みとみなさないため）
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ingested (
+            video_id TEXT PRIMARY KEY,
+            sha256 TEXT NOT NULL,
+            slides INTEGER,
+            completedat TEXT
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_ingested_sha256 ON ingested (sha256)")
+    return conn
+
+def now():
+    return datetime.utcnow().isoformat()
+
+# ジョブ登録（ジョブIDを返す）
+def enqueue(video_path, video_name, course, section, video_id):
+    job_id = uuid.uuid4().hex
+    conn = connect()
+    conn.execute("""
+        INSERT INTO jobs (id, status, video_path, video_name, course, section, video_id, stage, done, total, createdat, updatedat)
+        VALUES (?, 'queued', ?, ?, ?, ?, ?, 'queued', 0, 0, ?, ?)
+    """, (job_id, video_path, video_name, course, section, video_id, now(), now()))
+    conn.close()
+    return job_id
+
+# 待ち行列の先頭のジョブを取り出して running にする（複数ワーカーが同時に呼んでも重複しない）
+def claim_next(worker):
+    conn = connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY createdat LIMIT 1").fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        conn.execute("UPDATE jobs SET status = 'running', worker = ?, updatedat = ? WHERE id = ?", (worker, now(), row["id"]))
+        conn.execute("COMMIT")
+        return dict(row)
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+# 段階ごとの進捗
+def update_progress(job_id, stage, done=0, total=0):
+    conn = connect()
+    conn.execute("UPDATE jobs SET stage = ?, done = ?, total = ?, updatedat = ? WHERE id = ?", (stage, done, total, now(), job_id))
+    conn.close()
+
+def finish(job_id, message):
+    conn = connect()
+    conn.execute("UPDATE jobs SET status = 'done', stage = 'done', message = ?, updatedat = ? WHERE id = ?", (message, now(), job_id))
+    conn.close()
+
+def fail(job_id, message):
+    conn = connect()
+    conn.execute("UPDATE jobs SET status = 'failed', message = ?, updatedat = ? WHERE id = ?", (message, now(), job_id))
+    conn.close()
+
+# ワーカーが落ちて running のまま残ったジョブを待ち行列に戻す（段階キャッシュにより続きから再開される）
+def requeue_running():
+    conn = connect()
+    count = conn.execute("UPDATE jobs SET status = 'queued', worker = NULL, updatedat = ? WHERE status = 'running'", (now(),)).rowcount
+    conn.close()
+    return count
+
+# 取り込みの完了を記録する（slides: Chromaに保存したスライド数）
+def mark_ingested(video_id, sha256, slides):
+    conn = connect()
+    conn.execute("""
+        INSERT INTO ingested (video_id, sha256, slides, completedat) VALUES (?, ?, ?, ?)
+        ON CONFLICT (video_id) DO UPDATE SET sha256 = excluded.sha256, slides = excluded.slides, completedat = excluded.completedat
+    """, (video_id, sha256, slides, now()))
+    conn.close()
+
+# 取り込みを始める前に完了の記録を消す（書き込みの途中で落ちたら未完了のまま残る）
+def clear_ingested(video_id):
+    conn = connect()
+    conn.execute("DELETE FROM ingested WHERE video_id = ?", (video_id,))
+    conn.close()
+
+# 同じ内容の動画で取り込みが完了したものの [(video_id, スライド数)]（古い順）
+def completed_ingests(sha256):
+    conn = connect()
+    rows = conn.execute("SELECT video_id, slides FROM ingested WHERE sha256 = ? ORDER BY completedat", (sha256,)).fetchall()
+    conn.close()
+    return [(row["video_id"], row["slides"]) for row in rows]
+
+def get_job(job_id):
+    conn = connect()
+    row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+# 使い方:
+#   python job_queue.py enqueue <動画パス> <動画名> <コース> <セクション> <動画ID>  → {"jobId": ...}
+#   python job_queue.py status <ジョブID>  → ジョブの状態（JSON）
+if __name__ == "__main__":
+    command = sys.argv[1]
+    if command == "enqueue":
+        print(json.dumps({"jobId": enqueue(*sys.argv[2:7])}))
+    elif command == "status":
+        job = get_job(sys.argv[2])
+        print(json.dumps(job, ensure_ascii=False) if job else "null")
+    else:
+        sys.exit(f"未知のコマンド: {command}")
@@ -0,0 +1,159 @@
+import os
+import sys
+import hashlib
+import sqlite3
+import unicodedata
+from mecab_util import get_tagger, STOP_WORDS
+
+# 文字起こしとOCRキーワードの全文検索インデックス（SQLite FTS5 の BM25）
+# MeCabで分かち書きした語を空白区切りで入れるので、専門用語を語単位で完全一致させられる
+# Chromaと同じIDで持ち、ChromaWriter の書き込み・削除と一緒に更新する（sync() で作り直しも可能）
+LEXICAL_DB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../src/lexical_index.sqlite3"))
+CONTENT_POS = ("名詞", "動詞", "形容詞")
+OCR_WEIGHT = 1.5  # OCRキーワード列の重み（文字起こし列は1.0）
+FILTER_KEYS = ("course", "section", "video_id")
+TOKENIZER_VERSION = "surface-1"  # 分かち書きの方法を変えたら上げる（meta の値と違えば sync() で全文書を入れ直す）
+
+# 内容語（名詞・動詞・形容詞）の表層形を取り出す。全角英数字などは NFKC で揃え、英字は小文字にする
+# 原形の位置は辞書で異なる（IPAdicは7番目、UniDicは8番目で7番目は読み）ので、どの辞書でも同じになる表層形を使う
+def tokenize(text):
+    tokens = []
+    node = get_tagger().parseToNode(unicodedata.normalize("NFKC", text or ""))
+    while node:
+        features = node.feature.split(",")
+        surface = node.surface.strip()
+        if features[0] in CONTENT_POS and surface and surface not in STOP_WORDS:
+            tokens.append(surface.lower())
+        node = node.next
+    return tokens
+
+# FTS5 の検索式（語のどれかを含む文書。語はダブルクォーテーションで囲んで演算子として解釈させない）
+def match_query(tokens):
+    return " OR ".join('"' + t.replace('"', '""') + '"' for t in dict.fromkeys(tokens))
+
+def _fingerprint(document, metadata):
+    data = "\n".join([TOKENIZER_VERSION, document or ""] + [str(metadata.get(k, "")) for k in ("ocr",) + FILTER_KEYS])
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class LexicalIndex:
+    def __init__(self, path=LEXICAL_DB_PATH):
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        # FTS5 の rowid と Chroma のIDの対応、および変更検出用の内容ハッシュ
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS slide_map (
+                rid INTEGER PRIMARY KEY,
+                id TEXT UNIQUE NOT NULL,
+                sha256 TEXT NOT NULL
+            )
+        ''')
+        self.conn.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS slides USING fts5(
+                doc, ocr, course UNINDEXED, section UNINDEXED, video_id UNINDEXED, tokenize = "unicode61"
+            )
+        ''')
+        # インデックスを作ったときの分かち書きの方法（TOKENIZER_VERSION）
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        if self.tokenizer_version() is None and self.count() == 0:
+            self._set_tokenizer_version()
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def _delete(self, ids):
+        for id_ in ids:
+            row = self.conn.execute("SELECT rid FROM slide_map WHERE id = ?", (id_,)).fetchone()
+            if row:
+                self.conn.execute("DELETE FROM slides WHERE rowid = ?", row)
+                self.conn.execute("DELETE FROM slide_map WHERE rid = ?", row)
+
+    # Chromaに upsert したのと同じ内容を入れる
+    def upsert(self, ids, documents, metadatas):
+        with self.conn:
+            self._delete(ids)
+            for id_, document, meta in zip(ids, documents, metadatas):
+                rid = self.conn.execute("INSERT INTO slide_map (id, sha256) VALUES (?, ?)",
+                                        (id_, _fingerprint(document, meta))).lastrowid
+                self.conn.execute("""
+                    INSERT INTO slides (rowid, doc, ocr, course, section, video_id) VALUES (?, ?, ?, ?, ?, ?)
+                """, (rid, " ".join(tokenize(document)), " ".join(tokenize(meta.get("ocr", ""))),
+                      meta.get("course"), meta.get("section"), meta.get("video_id")))
+
+    def delete(self, ids):
+        with self.conn:
+            self._delete(ids)
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM slide_map").fetchone()[0]
+
+    def tokenizer_version(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'tokenizer_version'").fetchone()
+        return row[0] if row else None
+
+    def _set_tokenizer_version(self):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('tokenizer_version', ?)", (TOKENIZER_VERSION,))
+
+    # Chromaと件数が合わないか、分かち書きの方法が変わっていれば sync() が必要
+    def needs_sync(self, collection):
+        return self.tokenizer_version() != TOKENIZER_VERSION or self.count() != collection.count()
+
+    # BM25 で上位 n_results 件の (ID, スコア) を返す（スコアは大きいほど関連が高い）
+    # filters: {"course": ..., "section": ..., "video_id": ...} のうち指定したものに一致する文書だけを対象にする
+    def search(self, query, n_results=5, filters=None):
+        expression = match_query(tokenize(query))
+        if not expression:
+            return []
+        conditions = ["slides MATCH ?"]
+        params = [expression]
+        for key, value in (filters or {}).items():
+            if key not in FILTER_KEYS:
+                raise ValueError(f"未対応の絞り込み条件: {key}")
+            conditions.append(f"slides.{key} = ?")
+            params.append(value)
+        rows = self.conn.execute(f"""
+            SELECT slide_map.id, -bm25(slides, 1.0, {OCR_WEIGHT}) AS score
+            FROM slides JOIN slide_map ON slide_map.rid = slides.rowid
+            WHERE {" AND ".join(conditions)}
+            ORDER BY score DESC
+            LIMIT ?
+        """, params + [n_results]).fetchall()
+        return rows
+
+    # Chromaのコレクション全体と突き合わせ、増えた・変わった文書を入れ直し、消えた文書を削除する
+    # 戻り値は (更新件数, 削除件数)
+    def sync(self, collection, page_size=500):
+        known = dict(self.conn.execute("SELECT id, sha256 FROM slide_map").fetchall())
+        seen = set()
+        updated = 0
+        offset = 0
+        while True:
+            page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+            if not page["ids"]:
+                break
+            changed = [(id_, doc, meta) for id_, doc, meta in zip(page["ids"], page["documents"], page["metadatas"])
+                       if known.get(id_) != _fingerprint(doc, meta)]
+            seen.update(page["ids"])
+            if changed:
+                self.upsert(*map(list, zip(*changed)))
+                updated += len(changed)
+            offset += len(page["ids"])
+        removed = [id_ for id_ in known if id_ not in seen]
+        self.delete(removed)
+        # 全文書を今の分かち書きで入れ終えたので記録する
+        with self.conn:
+            self._set_tokenizer_version()
+        return updated, len(removed)
+
+
+# Chromaの内容からインデックスを同期する
+# 使い方: python lexical_index.py [ChromaのDBディレクトリ]
+if __name__ == "__main__":
+    from chromadb import PersistentClient
+    chroma_path = sys.argv[1] if len(sys.argv) > 1 else os.path.abspath(os.path.join(os.path.dirname(__file__), "../src/chroma_db"))
+    collection = PersistentClient(path=chroma_path).get_or_create_collection("video-transcripts")
+    index = LexicalIndex()
+    updated, removed = index.sync(collection)
+    print(f"全文検索インデックスを同期しました（更新 {updated}件  削除 {removed}件  合計 {index.count()}件）")
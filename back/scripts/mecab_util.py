@@ -0,0 +1,16 @@
+import MeCab
+
+# MeCabの共通部品（OCRのキーワード抽出と全文検索の分かち書きで使う）
+# pytesseract・PIL を読み込まないので、検索側のスクリプトはOCRの依存なしで使える
+
+# 除外対象の表層形（助詞や不要語）
+STOP_WORDS = {"に", "は", "を", "で", "の", "と", "が", "や", "など", "そして", "です", "ます", "から", "より", "まで", "へ", "ね", "よ"}
+
+# MeCabはプロセスごとに1つだけ生成（ワーカープロセスでも使い回す）
+_tagger = None
+
+def get_tagger():
+    global _tagger
+    if _tagger is None:
+        _tagger = MeCab.Tagger()
+    return _tagger
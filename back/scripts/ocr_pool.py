@@ -0,0 +1,59 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import pytesseract
+from PIL import Image
+from mecab_util import get_tagger, STOP_WORDS
+
+# OCR＋画像前処理＋キーワード抽出
+def extract_keywords_from_frame(frame):
+    try:
+        image = Image.fromarray(frame).convert("L")
+        image = image.point(lambda x: 0 if x < 128 else 255)  # 二値化
+        text = pytesseract.image_to_string(image, lang="jpn").strip()
+        if not text:
+            return ""
+
+        keywords = []
+        node = get_tagger().parseToNode(text)
+        while node:
+            features = node.feature.split(",")
+            surface = node.surface.strip()
+            # 名詞かつ除外語でないものを追加
+            if "名詞" in features[0] and surface and surface not in STOP_WORDS:
+                keywords.append(surface)
+            node = node.next
+
+        return " ".join(keywords)
+
+    except Exception as e:
+        print(f"[ERROR] OCR/処理失敗: {e}")
+        return ""
+
+# ワーカー初期化：tesseract内部のOpenMPスレッドがワーカー同士で取り合わないよう1本に制限
+def _init_worker():
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+# (t, frame) を受け取り、(t, キーワード) を時刻順に返す
+# frame が None（差分フィルタで省略されたフレーム）はOCRせず (t, None) を返す
+# workers <= 1 なら従来どおり直列で処理する
+def iter_ocr_results(frames, workers=1):
+    if workers <= 1:
+        for t, frame in frames:
+            yield t, (extract_keywords_from_frame(frame) if frame is not None else None)
+        return
+
+    # デコーダが先行しすぎてメモリを食わないよう、投入済みフレーム数に上限を設ける
+    max_pending = workers * 2
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        for t, frame in frames:
+            future = pool.submit(extract_keywords_from_frame, frame) if frame is not None else None
+            pending.append((t, future))
+            # 先頭から順に取り出すことで、完了順ではなく時刻順に返す
+            while len(pending) >= max_pending:
+                t0, f0 = pending.popleft()
+                yield t0, (f0.result() if f0 is not None else None)
+        while pending:
+            t0, f0 = pending.popleft()
+            yield t0, (f0.result() if f0 is not None else None)
@@ -0,0 +1,192 @@
+import os
+import json
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+
+# Ollama呼び出しの共通クライアント
+# 接続はセッションで使い回し、タイムアウト・リトライ（指数バックオフ）付きで呼び出す
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434/api/generate")
+REQUEST_TIMEOUT = (10, 900)  # (接続, 応答) 秒。32Bモデルは1スライドに数分かかることがある
+MAX_RETRIES = 3
+BACKOFF = 2.0  # 1回目の再試行までの秒数（以降2倍ずつ）
+
+
+class OllamaClient:
+    # options: Ollamaの生成オプション（temperature など。省略時はモデルの既定値）
+    def __init__(self, model, url=OLLAMA_URL, options=None, timeout=REQUEST_TIMEOUT, max_retries=MAX_RETRIES, backoff=BACKOFF, pool_size=8):
+        self.model = model
+        self.options = options or {}
+        self.url = url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        # 並行数ぶんの接続をプールしておく
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    # 接続エラー・タイムアウト・5xx は待ってから再試行し、それ以外のエラーはそのまま返す
+    def _post(self, payload, stream=False):
+        for attempt in range(self.max_retries + 1):
+            try:
+                res = self.session.post(self.url, json=payload, timeout=self.timeout, stream=stream)
+                if res.status_code < 500:
+                    res.raise_for_status()
+                    return res
+                error = requests.HTTPError(f"{res.status_code} {res.reason}", response=res)
+                res.close()
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            if attempt == self.max_retries:
+                raise error
+            wait = self.backoff * (2 ** attempt) * (0.5 + random.random())
+            print(f"[WARN] Ollama呼び出し失敗（{error}）。{wait:.1f}秒後に再試行 ({attempt + 1}/{self.max_retries})")
+            time.sleep(wait)
+
+    # format: 出力を制約するJSONスキーマ（Ollamaの format オプション）
+    def _payload(self, prompt, stream, format=None):
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": stream
+        }
+        if self.options:
+            payload["options"] = self.options
+        if format:
+            payload["format"] = format
+        return payload
+
+    def generate(self, prompt):
+        res = self._post(self._payload(prompt, stream=False))
+        return res.json()["response"]
+
+    # ストリーミング生成：NDJSONで届くトークンを受け取りながら、JSON配列の要素を閉じた順に on_item に渡す
+    # 配列が閉じた時点で接続を切り、後続の説明文などのトークン生成を打ち切る
+    # 戻り値は (取り出せた要素のリスト, 受信した全文, 配列が最後まで閉じたか, 統計)
+    # 統計: tokens（受信したトークン数。1チャンク=1トークン）, failed（パースできなかった要素数）
+    def generate_json_array(self, prompt, on_item=None, format=None):
+        res = self._post(self._payload(prompt, stream=True, format=format), stream=True)
+        parser = JsonArrayStreamParser()
+        items = []
+        tokens = 0
+        try:
+            for line in res.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                tokens += 1 if chunk.get("response") else 0
+                for item in parser.feed(chunk.get("response", "")):
+                    items.append(item)
+                    if on_item:
+                        on_item(item)
+                if parser.complete or chunk.get("done"):
+                    break
+        finally:
+            res.close()
+        return items, parser.text, parser.complete, {"tokens": tokens, "failed": parser.failed}
+
+    def close(self):
+        self.session.close()
+
+
+# 少しずつ届くテキストから、最上位のJSON配列の要素（オブジェクト）を閉じた順に取り出す
+# 配列より前の <think>...</think> や前置きの文章は読み飛ばす
+class JsonArrayStreamParser:
+    def __init__(self):
+        self.text = ""
+        self.pos = 0
+        self.in_think = False
+        self.started = False
+        self.complete = False
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.obj_start = None
+        self.failed = 0
+
+    # 配列の開始位置まで読み進める（見つかれば True）
+    def _find_start(self):
+        while not self.started:
+            if self.in_think:
+                end = self.text.find("</think>", self.pos)
+                if end < 0:
+                    self.pos = max(self.pos, len(self.text) - len("</think>"))
+                    return False
+                self.pos = end + len("</think>")
+                self.in_think = False
+                continue
+            think = self.text.find("<think>", self.pos)
+            bracket = self.text.find("[", self.pos)
+            if think >= 0 and (bracket < 0 or think < bracket):
+                self.pos = think + len("<think>")
+                self.in_think = True
+            elif bracket >= 0:
+                self.pos = bracket + 1
+                self.started = True
+            else:
+                # タグが途中で切れている可能性があるので末尾は読み残す
+                self.pos = max(self.pos, len(self.text) - len("<think>"))
+                return False
+        return True
+
+    def feed(self, chunk):
+        self.text += chunk
+        items = []
+        if self.complete or not self._find_start():
+            return items
+
+        text = self.text
+        i = self.pos
+        while i < len(text):
+            c = text[i]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif c == "\\":
+                    self.escape = True
+                elif c == '"':
+                    self.in_string = False
+            elif c == '"':
+                self.in_string = True
+            elif c == "{":
+                if self.depth == 0:
+                    self.obj_start = i
+                self.depth += 1
+            elif c == "}":
+                self.depth -= 1
+                if self.depth == 0 and self.obj_start is not None:
+                    try:
+                        item = json.loads(text[self.obj_start:i + 1])
+                        if isinstance(item, dict):
+                            items.append(item)
+                        else:
+                            self.failed += 1
+                    except json.JSONDecodeError as e:
+                        self.failed += 1
+                        print(f"[WARN] 要素のJSONパースに失敗: {e}")
+                    self.obj_start = None
+            elif c == "]" and self.depth == 0:
+                self.complete = True
+                i += 1
+                break
+            i += 1
+        self.pos = i
+        return items
+
+
+# 受信済みの全文から配列の要素を取り出す（キャッシュした応答の読み直しなど）
+def parse_json_array(text):
+    return JsonArrayStreamParser().feed(text)
+
+
+# 複数の入力を最大 concurrency 件まで並行して generate に渡し、(番号, future) を入力順に返す
+# 呼び出し側は順番に future.result() を取り出せば、完了順に関係なくスライド順で処理できる
+def generate_in_order(generate, items, concurrency):
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(generate, item) for item in items]
+        for idx, future in enumerate(futures):
+            yield idx, future
@@ -1,16 +1,15 @@
 import os
 import sys
-import io
-import uuid
-import shutil
-import subprocess
-import MeCab
 from datetime import datetime
-import pytesseract
-from PIL import Image
-from sentence_transformers import SentenceTransformer, util
 import chromadb
-from mlx_whisper import transcribe
+from asr_backends import get_asr_backend, ASR_BACKEND
+from video_io import get_duration, iter_frames, iter_changed_frames, load_audio, SAMPLE_RATE
+from ocr_pool import iter_ocr_results
+from ingest_cache import StageCache, file_sha256
+import job_queue
+from embedding import get_encoder, pairwise_cos_sim, EMBED_ENGINE
+from chroma_writer import ChromaWriter
+from lexical_index import LexicalIndex
 
 # ====== デバッグ用フラグ ======
 DEBUG = False
@@ -18,181 +17,329 @@ SKIP_OCR = False
 SKIP_ASR = False
 SKIP_SAVE = False
 VERBOSE_TRANSCRIBE = False
+USE_CACHE = True  # 段階ごとのキャッシュを使って途中から再開する
+# 同じ内容の動画が登録済みでも処理し直す（環境変数 FORCE_REPROCESS=1 か、CLIの --force）
+FORCE_REPROCESS = os.environ.get("FORCE_REPROCESS") == "1" or "--force" in sys.argv
 
 
-# 引数
-video_path = sys.argv[1]
-video_name = sys.argv[2]
-course = sys.argv[3]
-section = sys.argv[4]
-video_id = sys.argv[5]
-
 # 各種設定
 CHROMA_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../src/chroma_db"))
-TMP_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../src/tmp_movies"))
-TMP_DIR = os.path.join(TMP_ROOT, str(uuid.uuid4()))
+EMBED_MODEL = "cl-nagoya/ruri-small"
+OCR_ENGINE = "tesseract-jpn/bin128/mecab-noun"  # OCR処理の中身を変えたらここも変えてキャッシュを無効にする
 INTERVAL = 5
 SIM_THRESHOLD = 0.85
-createdat = datetime.utcnow().isoformat()
-
-# モデルとツール
-embedder = SentenceTransformer("cl-nagoya/ruri-small", trust_remote_code=True)
-tagger = MeCab.Tagger()
-
-# 動画長取得
-def get_duration(video_path):
-    out = subprocess.run(
-        ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", video_path],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT
-    )
-    return float(out.stdout.decode().strip())
-
-# OCR＋画像前処理＋キーワード抽出
-def extract_keywords_from_frame(video_path, time_sec):
-    result = subprocess.run(
-        ["ffmpeg", "-ss", str(time_sec), "-i", video_path, "-frames:v", "1", "-f", "image2pipe", "-vcodec", "png", "pipe:1"],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.DEVNULL
-    )
-    try:
-        image = Image.open(io.BytesIO(result.stdout)).convert("L")
-        image = image.point(lambda x: 0 if x < 128 else 255)  # 二値化
-        text = pytesseract.image_to_string(image, lang="jpn").strip()
-        if not text:
-            return ""
-
-        # 除外対象の表層形（助詞や不要語）
-        stop_words = {"に", "は", "を", "で", "の", "と", "が", "や", "など", "そして", "です", "ます", "から", "より", "まで", "へ", "ね", "よ"}
-
-        keywords = []
-        node = tagger.parseToNode(text)
-        while node:
-            features = node.feature.split(",")
-            surface = node.surface.strip()
-            # 名詞かつ除外語でないものを追加
-            if "名詞" in features[0] and surface and surface not in stop_words:
-                keywords.append(surface)
-            node = node.next
-
-        return " ".join(keywords)
-
-    except Exception as e:
-        print(f"[ERROR] OCR/処理失敗: {e}")
-        return ""
+DIFF_THRESHOLD = 2.0  # 直前にOCRしたフレームとの平均絶対差がこれ未満ならOCRを省略（0で無効）
+EMBED_BATCH_SIZE = 64  # キーワード埋め込みのバッチサイズ
+ASR_BATCH_SIZE = int(os.environ.get("ASR_BATCH_SIZE", 8))  # まとめて音声認識するスライド数
+OCR_WORKERS = int(os.environ.get("OCR_WORKERS", os.cpu_count() or 1))  # OCRの並列プロセス数（1で直列）
+PROGRESS_EVERY = 20  # OCRの進捗を何フレームごとに通知するか
+
+# モデル（OCRワーカープロセスで読み込まれないよう初回利用時にロード）
+_embedder = None
+_asr = None
+
+# 埋め込みサービス（embed_service.py）が起動していればそれを使い、なければこのプロセスで読み込む
+def get_embedder():
+    global _embedder
+    if _embedder is None:
+        _embedder = get_encoder(EMBED_MODEL, EMBED_ENGINE)
+    return _embedder
+
+# 音声認識エンジン（環境変数 ASR_BACKEND で mlx / faster-whisper / stub を選択）
+def get_asr():
+    global _asr
+    if _asr is None:
+        kwargs = {"verbose": VERBOSE_TRANSCRIBE} if ASR_BACKEND == "mlx" else {}
+        _asr = get_asr_backend(ASR_BACKEND, **kwargs)
+    return _asr
+
+# 進捗通知（ジョブキューから呼ぶときは段階ごとの進捗を記録する関数を渡す）
+def _no_progress(stage, done=0, total=0):
+    pass
+
+# キーワード列をまとめて埋め込み、隣り合うフレーム間のコサイン類似度を一括で計算
+def compute_adjacent_similarities(keywords_list):
+    if len(keywords_list) < 2:
+        return []
+    embeddings = get_embedder().encode(keywords_list, batch_size=EMBED_BATCH_SIZE)
+    return pairwise_cos_sim(embeddings[1:], embeddings[:-1]).tolist()
+
+# 類似度の配列から境界を求める（類似度がしきい値を下回ったフレームの時刻を境界とする）
+def boundaries_from_similarities(times, sims, duration, threshold=SIM_THRESHOLD):
+    boundaries = [0.0]
+    for t, sim in zip(times[1:], sims):
+        if DEBUG:
+            print(f"[DEBUG] 類似度: {t}s {sim:.3f}")
+        if sim < threshold:
+            boundaries.append(float(t))
+    boundaries.append(duration)
+    return boundaries
 
+# フレーム抽出＋OCR段階：[t, キーワード] のリストを返す（キーワードが None のフレームは差分なしで省略）
+# 1フレームごとに途中経過を記録し、再実行時は処理済みのフレームをOCRしない
+def run_ocr_stage(video_path, duration, ocr_workers, cache, progress=_no_progress):
+    key = cache.key("ocr", {"interval": INTERVAL, "diff_threshold": DIFF_THRESHOLD, "engine": OCR_ENGINE})
+    results = cache.load(key)
+    if results is not None:
+        print("[INFO] OCR: キャッシュを使用")
+        return key, results
+
+    done = {r["t"]: r["keywords"] for r in cache.load_records(key)}
+    if done:
+        print(f"[INFO] OCR: {len(done)} フレーム処理済みのため続きから再開")
+
+    # 動画を1回だけデコード → 差分フィルタ → OCRワーカー の順に流し、結果は時刻順に受け取る
+    stats = {"total": 0, "skipped": 0}
+    frames = iter_frames(video_path, INTERVAL, duration)
+    frames = iter_changed_frames(frames, DIFF_THRESHOLD, stats)
+    frames = ((t, None if t in done else frame) for t, frame in frames)
+    results = []
+    total = (int(duration) + INTERVAL - 1) // INTERVAL
+    for t, keywords in iter_ocr_results(frames, ocr_workers):
+        if t in done:
+            keywords = done[t]
+        else:
+            cache.append_record(key, {"t": t, "keywords": keywords})
+        results.append([t, keywords])
+        if len(results) % PROGRESS_EVERY == 0:
+            progress("ocr", len(results), total)
+
+    print(f"[INFO] 差分フィルタでOCRをスキップ: {stats['skipped']}/{stats['total']} フレーム")
+    cache.save(key, results)
+    return key, results
 
 # スライド境界の検出
-def detect_slide_boundaries(duration):
+def detect_slide_boundaries(video_path, duration, ocr_workers=OCR_WORKERS, cache=None, progress=_no_progress):
+    cache = cache or StageCache.disabled()
     ocr_texts = []
-    embeddings = []
-    boundaries = [0.0]
+    embed_items = []  # 埋め込み対象（新たにOCRしたフレーム）の (t, キーワード)
+    last_keywords = ""
 
-    for t in range(0, int(duration), INTERVAL):
-        if SKIP_OCR:
+    progress("ocr")
+    ocr_key, ocr_results = run_ocr_stage(video_path, duration, ocr_workers, cache, progress) if not SKIP_OCR else (None, [])
+    for t, keywords in ocr_results:
+        # 見た目が変わっていないフレームはOCR・埋め込みを省略し、前回のキーワードを使う
+        if keywords is None:
+            if last_keywords:
+                ocr_texts.append((t, last_keywords))
             continue
-        keywords = extract_keywords_from_frame(video_path, t)
+        last_keywords = keywords
         if DEBUG:
             print(f"[DEBUG] OCR抽出中: {t}s -> {keywords}")
         if not keywords:
             continue
         ocr_texts.append((t, keywords))
-        emb = embedder.encode(keywords, convert_to_tensor=True)
-        embeddings.append(emb)
+        embed_items.append((t, keywords))
 
-        if len(embeddings) >= 2:
-            sim = util.cos_sim(embeddings[-1], embeddings[-2]).item()
-            if DEBUG:
-                print(f"[DEBUG] 類似度: {sim:.3f}")
-            if sim < SIM_THRESHOLD:
-                boundaries.append(float(t))
+    progress("boundaries")
+    # フレームごとに encode せず、全キーワードをバッチで埋め込んでから境界を求める
+    # 類似度はしきい値に依存しないので、SIM_THRESHOLD を変えても再計算しない
+    sims_key = cache.key("sims", {"ocr": ocr_key, "model": EMBED_MODEL, "engine": EMBED_ENGINE})
+    cached = cache.load(sims_key)
+    if cached is None:
+        times = [t for t, _ in embed_items]
+        sims = compute_adjacent_similarities([k for _, k in embed_items])
+        cache.save(sims_key, {"times": times, "sims": sims})
+    else:
+        times, sims = cached["times"], cached["sims"]
 
-    boundaries.append(duration)
+    boundaries_key = cache.key("boundaries", {"sims": sims_key, "threshold": SIM_THRESHOLD, "duration": duration})
+    boundaries = cache.load(boundaries_key)
+    if boundaries is None:
+        boundaries = boundaries_from_similarities(times, sims, duration)
+        cache.save(boundaries_key, boundaries)
     return ocr_texts, boundaries
 
-# 動画を一時ファイルとして保存
-def extract_segment(video_path, start, end, output_path):
-    subprocess.run([
-        "ffmpeg", "-y", "-ss", str(start), "-to", str(end),
-        "-i", video_path, "-c:v", "copy", "-c:a", "copy", output_path
-    ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-
-# Whisper処理
-def transcribe_with_mlx_whisper(audio_path, ocr_text=""):
-    return transcribe(
-        audio_path,
-        path_or_hf_repo="mlx-community/whisper-large-v3-mlx",
-        language="ja",
-        task="transcribe",
-        initial_prompt=ocr_text,
-        verbose=VERBOSE_TRANSCRIBE,
-        condition_on_previous_text=False,
-        carry_initial_prompt=True
-    )
+# 音声認識段階：スライドごとの文字起こし {スライド番号: 文字列} を返す
+# バッチごとに途中経過を記録し、再実行時は認識済みのスライドを飛ばす
+# キーはスライドの区間とプロンプトそのものから作るので、境界が変わらなければ再利用される
+# on_result(i, voice) はスライドの文字起こしが得られるたびに呼ぶ（キャッシュ済みの分も含む）
+def run_asr_stage(video_path, slides, cache, progress=_no_progress, on_result=None):
+    on_result = on_result or (lambda i, voice: None)
+    key = cache.key("asr", {"slides": slides, "backend": ASR_BACKEND, "language": "ja"})
+    voices = cache.load(key)
+    if voices is not None:
+        print("[INFO] 音声認識: キャッシュを使用")
+        voices = {int(i): voice for i, voice in voices.items()}
+        for i in sorted(voices):
+            on_result(i, voices[i])
+        return key, voices
+
+    voices = {r["i"]: r["voice"] for r in cache.load_records(key)}
+    pending = [slide for slide in slides if slide[0] not in voices]
+    if voices:
+        print(f"[INFO] 音声認識: {len(voices)} スライド処理済みのため続きから再開")
+        for i in sorted(voices):
+            on_result(i, voices[i])
+
+    # 音声は認識が必要なときだけデコードする
+    audio = load_audio(video_path) if pending else None
+    failed = False
+
+    # ASR_BATCH_SIZE 枚ずつまとめて音声認識（プロンプトはスライドごと）
+    for b in range(0, len(pending), ASR_BATCH_SIZE):
+        batch = pending[b:b + ASR_BATCH_SIZE]
+        try:
+            if DEBUG:
+                print(f"[DEBUG] 音声認識: slide-{batch[0][0]}〜slide-{batch[-1][0]}")
+            # 一時ファイルを作らず、デコード済み音声のスライス（コピーなし）をそのまま渡す
+            segments = [audio[int(start * SAMPLE_RATE):int(end * SAMPLE_RATE)] for _, start, end, _ in batch]
+            results = get_asr().transcribe_batch(segments, [ocr for _, _, _, ocr in batch], language="ja")
+        except Exception as e:
+            print(f"[ERROR] スライド{batch[0][0]}〜{batch[-1][0]}の音声認識に失敗: {e}")
+            failed = True
+            continue
+
+        for (i, _, _, _), voice in zip(batch, results):
+            voices[i] = voice
+            cache.append_record(key, {"i": i, "voice": voice})
+            on_result(i, voice)
+        progress("asr", len(voices), len(slides))
+
+    # 失敗したバッチがあれば完了扱いにせず、次回その分だけ再実行する
+    if not failed:
+        cache.save(key, voices)
+    return key, voices
+
+# 同じ内容（SHA-256）の動画の取り込みが完了していれば、その文字起こし・埋め込みに新しいメタ情報を付けて登録する
+# 完了の記録（job_queue の ingested）があり、Chromaにその件数がそろっている動画だけを登録済みとみなす
+# （途中で落ちた取り込みの一部だけの結果は使わない。Chromaを作り直したときも処理し直す）
+# 登録済みでなければ None、再利用したら結果のメッセージを返す
+def reuse_existing_results(video_meta):
+    client = chromadb.PersistentClient(path=CHROMA_PATH)
+    collection = client.get_or_create_collection("video-transcripts")
+    video_id = video_meta["video_id"]
+    # 同じ video_id の記録を先に見る
+    completed = sorted(job_queue.completed_ingests(video_meta["sha256"]), key=lambda row: row[0] != video_id)
+    for src_id, slides in completed:
+        where = {"$and": [{"video_id": src_id}, {"sha256": video_meta["sha256"]}]}
+        if len(collection.get(where=where, include=[])["ids"]) != slides:
+            continue
+        if src_id == video_id:
+            return f"同じ動画が video_id={video_id} として登録済みのため処理を省略しました"
+
+        src = collection.get(where=where, include=["documents", "metadatas", "embeddings"])
+        ids = [f"{video_id}-{id_[len(src_id) + 1:]}" for id_ in src["ids"]]
+        if not SKIP_SAVE:
+            # 埋め込みはコピー元のものをそのまま使う
+            job_queue.clear_ingested(video_id)
+            writer = ChromaWriter(collection, video_id, embed=None, lexical=LexicalIndex())
+            for id_, document, meta, embedding in zip(ids, src["documents"], src["metadatas"], src["embeddings"]):
+                writer.add(id_, document, {**meta, **video_meta}, embedding=embedding)
+            writer.finish()
+            job_queue.mark_ingested(video_id, video_meta["sha256"], len(ids))
+        return f"同じ動画（video_id={src_id}）の結果 {len(ids)}件 を video_id={video_id} として登録しました"
+    return None
 
 # メイン処理
-def process_and_store(ocr_texts, boundaries):
+# video_meta: 全ドキュメント共通のメタ情報（video, video_id, course, section, createdat, sha256）
+def process_and_store(video_path, ocr_texts, boundaries, video_meta, cache=None, progress=_no_progress):
+    cache = cache or StageCache.disabled()
     client = chromadb.PersistentClient(path=CHROMA_PATH)
     collection = client.get_or_create_collection("video-transcripts")
-    documents, metadatas, ids = [], [], []
 
+    # スライドごとの区間と、その中央時刻までに得られたOCRキーワード（プロンプト用）
+    slides = []
     for i in range(len(boundaries) - 1):
         start = boundaries[i]
         end = boundaries[i+1]
-        segment_path = os.path.join(TMP_DIR, f"slide-{i}.mp4")
 
         if DEBUG:
-            print(f"[DEBUG] スライド{i}: {start}〜{end} 秒 切り出し中...")
-        extract_segment(video_path, start, end, segment_path)
+            print(f"[DEBUG] スライド{i}: {start}〜{end} 秒")
 
         ocr = ""
         for t, txt in reversed(ocr_texts):
             if t <= (start + end) / 2:
                 ocr = txt
                 break
+        slides.append((i, start, end, ocr))
 
-        try:
-            if SKIP_ASR:
-                voice = "[SKIPPED ASR]"
-            else:
-                if DEBUG:
-                    print(f"[DEBUG] 音声認識: slide-{i}.mp4 + prompt='{ocr[:30]}...'")
-                result = transcribe_with_mlx_whisper(segment_path, ocr)
-                voice = result.get("text", "").strip()
-            if not voice:
-                continue
-            documents.append(voice)
-            metadatas.append({
-                "video": video_name,
-                "video_id": video_id,
-                "course": course,
-                "section": section,
-                "start": start,
-                "end": end,
-                "createdat": createdat,
-                "ocr": ocr
-            })
-            ids.append(f"{video_id}-slide{i}")
-        except Exception as e:
-            print(f"[ERROR] スライド{i}の音声認識に失敗: {e}")
+    # 埋め込みはバッチごとにキャッシュする（再開時に同じバッチなら埋め込み直さない）
+    def embed(documents):
+        key = cache.key("embeddings", {"documents": documents, "model": EMBED_MODEL, "engine": EMBED_ENGINE})
+        embeddings = cache.load_array(key)
+        if embeddings is None:
+            embeddings = get_embedder().encode(documents)
+            cache.save_array(key, embeddings)
+        return embeddings
+
+    # 音声認識が終わったスライドから順に、CHROMA_BATCH_SIZE 件ずつ埋め込んで保存する
+    video_id = video_meta["video_id"]
+    writer = None
+    if not SKIP_SAVE:
+        # 書き込みを始める前に完了の記録を消し、最後まで保存できたときだけ付け直す
+        job_queue.clear_ingested(video_id)
+        writer = ChromaWriter(collection, video_id, embed, progress=lambda done: progress("save", done, len(slides)),
+                              lexical=LexicalIndex())
+    by_index = {i: (start, end, ocr) for i, start, end, ocr in slides}
 
-    if not SKIP_SAVE and documents:
+    def store(i, voice):
+        if writer is None or not voice:
+            return
+        start, end, ocr = by_index[i]
         if DEBUG:
-            print(f"[DEBUG] {len(documents)}件のドキュメントをChromaに保存中...")
-        embeddings = embedder.encode(documents)
-        collection.add(documents=documents, embeddings=embeddings.tolist(), metadatas=metadatas, ids=ids)
+            print(f"[DEBUG] slide-{i} をChromaに保存待ちに追加")
+        writer.add(f"{video_id}-slide{i}", voice, {
+            **video_meta,
+            "start": start,
+            "end": end,
+            "ocr": ocr
+        })
+
+    if SKIP_ASR:
+        voices = {i: "[SKIPPED ASR]" for i, _, _, _ in slides}
+        for i in sorted(voices):
+            store(i, voices[i])
+    else:
+        progress("asr", 0, len(slides))
+        _, voices = run_asr_stage(video_path, slides, cache, progress, on_result=store)
+
+    if writer is not None:
+        # 音声認識に失敗したスライドは以前の結果を残し、スライドが減った分などの古いIDは削除する
+        failed = [f"{video_id}-slide{i}" for i, _, _, _ in slides if i not in voices]
+        removed = writer.finish(keep=failed)
+        if removed:
+            print(f"[INFO] 古いスライド {removed}件 をChromaから削除しました")
+        if not failed:
+            job_queue.mark_ingested(video_id, video_meta["sha256"], len(writer.written))
 
-    print("スライド分割・音声認識・Chroma保存が完了しました")
+    return "スライド分割・音声認識・Chroma保存が完了しました"
+
+# 動画1本の取り込み（CLI とジョブキューのワーカーの両方から呼ぶ）
+def ingest_video(video_path, video_name, course, section, video_id, progress=_no_progress):
+    # 動画の内容ハッシュ：再アップロードの検出とキャッシュのキーに使う
+    progress("hash")
+    content_hash = file_sha256(video_path)
+    video_meta = {
+        "video": video_name,
+        "video_id": video_id,
+        "course": course,
+        "section": section,
+        "createdat": datetime.utcnow().isoformat(),
+        "sha256": content_hash
+    }
+    if not FORCE_REPROCESS:
+        message = reuse_existing_results(video_meta)
+        if message:
+            return message
+
+    # 動画の内容ハッシュごとにキャッシュする（ファイル名が変わっても同じ動画なら再利用）
+    cache = StageCache(content_hash) if USE_CACHE else StageCache.disabled()
+
+    duration = get_duration(video_path)
+    if DEBUG:
+        print(f"[DEBUG] 動画長：{duration:.2f} 秒")
+    ocr_texts, boundaries = detect_slide_boundaries(video_path, duration, cache=cache, progress=progress)
+    return process_and_store(video_path, ocr_texts, boundaries, video_meta, cache, progress)
 
 # 実行部分
 if __name__ == "__main__":
-    os.makedirs(TMP_DIR, exist_ok=True)
-    try:
-        duration = get_duration(video_path)
-        if DEBUG:
-            print(f"[DEBUG] 動画長：{duration:.2f} 秒")
-        ocr_texts, boundaries = detect_slide_boundaries(duration)
-        process_and_store(ocr_texts, boundaries)
-    finally:
-        if os.path.exists(TMP_DIR):
-            shutil.rmtree(TMP_DIR)
+    # 引数（--force を付けると登録済みでも処理し直す）
+    args = [arg for arg in sys.argv[1:] if arg != "--force"]
+    video_path = args[0]
+    video_name = args[1]
+    course = args[2]
+    section = args[3]
+    video_id = args[4]
+
+    print(ingest_video(video_path, video_name, course, section, video_id))
@@ -0,0 +1,394 @@
+import os
+import time
+import hashlib
+import unicodedata
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+# src/qg.sqlite3 への保存
+# 接続はプロセスで1つだけ作って使い回し、WALモードでNodeサーバの読み込みと生成の書き込みを同時に行えるようにする
+DB_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../src/qg.sqlite3"))
+
+_conn = None
+_lock = threading.Lock()  # 生成スレッドから使われても1接続を順番に使う
+
+def connect(db_path=None):
+    global _conn
+    with _lock:
+        if _conn is None:
+            _conn = sqlite3.connect(db_path or DB_PATH, timeout=30, check_same_thread=False)
+            _conn.execute("PRAGMA journal_mode=WAL")
+            _conn.execute("PRAGMA synchronous=NORMAL")  # WALではコミットごとのfsyncを省いても壊れない
+            _conn.execute("PRAGMA busy_timeout=30000")
+            _conn.execute("PRAGMA temp_store=MEMORY")
+            _conn.execute("PRAGMA cache_size=-32000")  # 約32MB
+            migrate(_conn)
+        return _conn
+
+def close():
+    global _conn
+    with _lock:
+        if _conn is not None:
+            _conn.close()
+            _conn = None
+
+# スキーマのマイグレーション（PRAGMA user_version に適用済みのバージョンを記録する）
+# 古いスクリプトが作った qg テーブル（model 列なし、または id 自動採番の別スキーマ）もここで揃える
+def _columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+# 1: model 列つきの qg テーブル。get_voice_from_chroma.py が作っていた講義全体の文字起こしは course_voice に移す
+def _migrate_1(conn):
+    columns = _columns(conn, "qg")
+    if "id" in columns and "qgid" not in columns:
+        conn.execute("ALTER TABLE qg RENAME TO qg_course_voice_old")
+        columns = []
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS qg (
+            qgid TEXT PRIMARY KEY,
+            videoId TEXT,
+            voice_chunk TEXT,
+            model TEXT,
+            explain TEXT,
+            question TEXT,
+            priority REAL,
+            course TEXT,
+            section TEXT,
+            chunk_index INTEGER,
+            createdat TEXT
+        )
+    ''')
+    if columns and "model" not in columns:
+        conn.execute("ALTER TABLE qg ADD COLUMN model TEXT")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS course_voice (
+            course TEXT PRIMARY KEY,
+            voice TEXT
+        )
+    ''')
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'qg_course_voice_old'").fetchone():
+        conn.execute("""
+            INSERT OR IGNORE INTO course_voice (course, voice)
+            SELECT course, voice FROM qg_course_voice_old WHERE voice IS NOT NULL
+        """)
+        conn.execute("DROP TABLE qg_course_voice_old")
+
+# 2: 同じスライドのQ&Aごとに繰り返していた voice_chunk を segment テーブルに分け、qg からは id で参照する
+def _migrate_2(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS segment (
+            id INTEGER PRIMARY KEY,
+            sha256 TEXT UNIQUE NOT NULL,
+            voice TEXT NOT NULL
+        )
+    ''')
+    for (voice,) in conn.execute("SELECT DISTINCT voice_chunk FROM qg WHERE voice_chunk IS NOT NULL").fetchall():
+        _segment_id(conn, voice)
+    conn.execute("CREATE INDEX idx_segment_voice_tmp ON segment (voice)")
+    conn.execute('''
+        CREATE TABLE qg_new (
+            qgid TEXT PRIMARY KEY,
+            videoId TEXT,
+            segment_id INTEGER REFERENCES segment(id),
+            model TEXT,
+            explain TEXT,
+            question TEXT,
+            priority REAL,
+            course TEXT,
+            section TEXT,
+            chunk_index INTEGER,
+            createdat TEXT
+        )
+    ''')
+    conn.execute("""
+        INSERT INTO qg_new (qgid, videoId, segment_id, model, explain, question, priority, course, section, chunk_index, createdat)
+        SELECT qg.qgid, qg.videoId, segment.id, qg.model, qg.explain, qg.question, qg.priority, qg.course, qg.section, qg.chunk_index, qg.createdat
+        FROM qg LEFT JOIN segment ON segment.voice = qg.voice_chunk
+    """)
+    conn.execute("DROP INDEX idx_segment_voice_tmp")
+    conn.execute("DROP TABLE qg")
+    conn.execute("ALTER TABLE qg_new RENAME TO qg")
+
+# 3: 動画ごとの一覧（videoId, createdat）と、講義・節ごとの重要度順（course, section, priority）の索引
+def _migrate_3(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_qg_video_createdat ON qg (videoId, createdat)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_qg_course_section_priority ON qg (course, section, priority)")
+
+# 4: 同じ動画・チャンク・質問文の行を1つにまとめ、(videoId, chunk_index, question_hash) で一意にする
+# 再実行や並行実行で同じ質問が来たときは INSERT ではなく UPDATE になる（qgid はそのまま残る）
+def _migrate_4(conn):
+    conn.execute("ALTER TABLE qg ADD COLUMN question_hash TEXT")
+    rows = conn.execute("SELECT qgid, question FROM qg").fetchall()
+    conn.executemany("UPDATE qg SET question_hash = ? WHERE qgid = ?", [(question_hash(q or ""), qgid) for qgid, q in rows])
+    # 既に重複している行は最後に作られたものだけを残す
+    conn.execute("""
+        DELETE FROM qg WHERE rowid NOT IN (
+            SELECT MAX(rowid) FROM qg GROUP BY videoId, chunk_index, question_hash
+        )
+    """)
+    conn.execute("CREATE UNIQUE INDEX idx_qg_question ON qg (videoId, chunk_index, question_hash)")
+
+# 5: セグメント（スライド）ごとの内容の指紋。文字起こし・OCRが変わったスライドだけを再生成するために使う
+def _migrate_5(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS qg_fingerprint (
+            videoId TEXT,
+            chunk_index INTEGER,
+            fingerprint TEXT NOT NULL,
+            updatedat TEXT,
+            PRIMARY KEY (videoId, chunk_index)
+        )
+    ''')
+
+# 6: 生成の統計（generate_question.py の save_metrics が書き込む）。以前はスクリプトが直接作っていたので IF NOT EXISTS
+# あわせて、これまでの削除で参照されなくなった segment を消す
+def _migrate_6(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS qg_metrics (
+            videoId TEXT,
+            model TEXT,
+            slides INTEGER,
+            failed_slides INTEGER,
+            parse_failure_rate REAL,
+            invalid_items INTEGER,
+            repair_requests INTEGER,
+            tokens INTEGER,
+            retried_tokens INTEGER,
+            createdat TEXT
+        )
+    ''')
+    _remove_orphan_segments(conn)
+
+MIGRATIONS = [_migrate_1, _migrate_2, _migrate_3, _migrate_4, _migrate_5, _migrate_6]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+# 未適用のマイグレーションを順に適用する（複数プロセスが同時に起動しても BEGIN IMMEDIATE で1つずつ）
+def migrate(conn):
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, step in enumerate(MIGRATIONS[version:], version + 1):
+            step(conn)
+            conn.execute(f"PRAGMA user_version = {number}")
+            print(f"qg.sqlite3 をスキーマ v{number} に更新しました")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+# 文字起こしの segment id（なければ追加する）
+def _segment_id(conn, voice):
+    digest = hashlib.sha256(voice.encode("utf-8")).hexdigest()
+    conn.execute("INSERT OR IGNORE INTO segment (sha256, voice) VALUES (?, ?)", (digest, voice))
+    return conn.execute("SELECT id FROM segment WHERE sha256 = ?", (digest,)).fetchone()[0]
+
+# どの qg 行からも参照されなくなった文字起こしを削除する（qg を削除したのと同じトランザクションで呼ぶ）
+def _remove_orphan_segments(conn):
+    conn.execute("DELETE FROM segment WHERE id NOT IN (SELECT segment_id FROM qg WHERE segment_id IS NOT NULL)")
+
+# ULID形式のID（先頭48bitがミリ秒の時刻、残り80bitが乱数。26文字のCrockford Base32）
+# 文字列の並びが作成順になり、調整なしにプロセス間で衝突しない
+# 同じミリ秒内ではプロセス内で乱数部を1ずつ増やし、単調増加を保つ
+ULID_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_ulid_lock = threading.Lock()
+_ulid_last = (0, 0)
+
+def new_qgid():
+    global _ulid_last
+    with _ulid_lock:
+        ms = time.time_ns() // 1_000_000
+        last_ms, last_rand = _ulid_last
+        if ms <= last_ms:
+            ms, rand = last_ms, last_rand + 1
+            if rand >= 1 << 80:
+                ms, rand = last_ms + 1, int.from_bytes(os.urandom(10), "big")
+        else:
+            rand = int.from_bytes(os.urandom(10), "big")
+        _ulid_last = (ms, rand)
+    value = (ms << 80) | rand
+    return "".join(ULID_ALPHABET[(value >> shift) & 31] for shift in range(125, -1, -5))
+
+# 質問文のハッシュ（全角・半角や空白の違いは同じ質問とみなす）
+def question_hash(question):
+    normalized = " ".join(unicodedata.normalize("NFKC", question).split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+# Q&Aのリストを qg テーブルの行にする（question / answer が空のものは除く）
+def qna_rows(video_id, course, section, voice, qna_list, chunk_index, model):
+    createdat = datetime.utcnow().isoformat()
+    rows = []
+    for item in qna_list:
+        question = item.get("question", "").strip()
+        answer = item.get("answer", "").strip()
+        try:
+            priority = float(item.get("priority", 0.0))
+        except (TypeError, ValueError):
+            priority = 0.0
+
+        if not question or not answer:
+            continue
+
+        rows.append((new_qgid(), video_id, voice, model, answer, question, priority, course, section, chunk_index, createdat, question_hash(question)))
+    return rows
+
+# 共有の接続で1トランザクションを実行する（例外が出たらロールバック）
+@contextmanager
+def transaction():
+    conn = connect()
+    with _lock:
+        with conn:
+            yield conn
+
+# 行をまとめて1トランザクションで書き込む（文字起こしは segment に入れて id で参照する）
+# 同じ (videoId, chunk_index, 質問) が既にあれば解答・重要度などを新しい内容で更新する
+def insert_qna_rows(rows):
+    with transaction() as conn:
+        _insert_qna_rows(conn, rows)
+    return len(rows)
+
+def _insert_qna_rows(conn, rows):
+    segment_ids = {voice: _segment_id(conn, voice) for voice in {row[2] for row in rows}}
+    conn.executemany("""
+        INSERT INTO qg (qgid, videoId, segment_id, model, explain, question, priority, course, section, chunk_index, createdat, question_hash)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (videoId, chunk_index, question_hash) DO UPDATE SET
+            segment_id = excluded.segment_id,
+            model = excluded.model,
+            explain = excluded.explain,
+            question = excluded.question,
+            priority = excluded.priority,
+            course = excluded.course,
+            section = excluded.section
+    """, [row[:2] + (segment_ids[row[2]],) + row[3:] for row in rows])
+
+# 動画のセグメントごとの指紋 {chunk_index: 指紋}
+def get_fingerprints(video_id):
+    with transaction() as conn:
+        return dict(conn.execute("SELECT chunk_index, fingerprint FROM qg_fingerprint WHERE videoId = ?", (video_id,)).fetchall())
+
+# 保存済みの指紋を内容で今のセグメントに対応づける（fingerprints: 今のセグメントの指紋を位置順に並べたもの）
+# スライドの挿入・削除で位置がずれたセグメントは、Q&Aと指紋の chunk_index を新しい位置に付け替えて使い回す
+# 指紋の合わないQ&Aは、その位置がなくなったか別のセグメントが移ってきたときだけ削除する
+# 同じ位置で内容が変わったセグメントは、再生成に成功したとき QnaBatch.commit() で置き換える（失敗したら前回のまま残る）
+# 戻り値は (付け替えたチャンク数, 削除したQ&Aの件数)
+def match_chunks(video_id, fingerprints):
+    with transaction() as conn:
+        stored = dict(conn.execute("SELECT chunk_index, fingerprint FROM qg_fingerprint WHERE videoId = ?", (video_id,)).fetchall())
+        # 位置も内容も同じものはそのまま。残りは同じ指紋の空いている位置から前の順に割り当てる
+        same = {idx for idx, fp in enumerate(fingerprints) if stored.get(idx) == fp}
+        free = {}
+        for old in sorted(stored):
+            if old not in same:
+                free.setdefault(stored[old], []).append(old)
+        moves = {}  # 元の位置 → 新しい位置
+        for idx, fp in enumerate(fingerprints):
+            if idx not in same and free.get(fp):
+                moves[free[fp].pop(0)] = idx
+        # 今のセグメント数より後ろの位置に残った指紋は削除する
+        gone = [(video_id, old) for olds in free.values() for old in olds if old >= len(fingerprints)]
+        removed = sum(conn.execute("DELETE FROM qg WHERE videoId = ? AND chunk_index = ?", key).rowcount for key in gone)
+        conn.executemany("DELETE FROM qg_fingerprint WHERE videoId = ? AND chunk_index = ?", gone)
+        # 一意索引がぶつからないよう、いったん負の位置に退避してから新しい位置に移す
+        # 移動先に残っている古いQ&Aと指紋（内容が変わったもの・指紋のないもの）は、移ってくるものに置き換えるので削除する
+        for table in ("qg", "qg_fingerprint"):
+            conn.executemany(f"UPDATE {table} SET chunk_index = ? WHERE videoId = ? AND chunk_index = ?",
+                             [(-1 - new, video_id, old) for old, new in moves.items()])
+        targets = [(video_id, new) for new in moves.values()]
+        removed += sum(conn.execute("DELETE FROM qg WHERE videoId = ? AND chunk_index = ?", key).rowcount for key in targets)
+        conn.executemany("DELETE FROM qg_fingerprint WHERE videoId = ? AND chunk_index = ?", targets)
+        for table in ("qg", "qg_fingerprint"):
+            conn.execute(f"UPDATE {table} SET chunk_index = -1 - chunk_index WHERE videoId = ? AND chunk_index < 0", (video_id,))
+        _remove_orphan_segments(conn)
+    return len(moves), removed
+
+# 今のセグメント（keep）に含まれないチャンクのQ&Aと指紋を削除し、削除したQ&Aの件数を返す
+def remove_chunks(video_id, keep):
+    keep = sorted(set(keep))
+    placeholders = ",".join("?" * len(keep))
+    condition = f"videoId = ? AND chunk_index NOT IN ({placeholders})" if keep else "videoId = ?"
+    with transaction() as conn:
+        removed = conn.execute(f"DELETE FROM qg WHERE {condition}", [video_id] + keep).rowcount
+        conn.execute(f"DELETE FROM qg_fingerprint WHERE {condition}", [video_id] + keep)
+        _remove_orphan_segments(conn)
+    return removed
+
+# 講義全体の文字起こしを保存する（登録済みなら False）
+def save_course_voice(course, voice):
+    with transaction() as conn:
+        cur = conn.execute("INSERT OR IGNORE INTO course_voice (course, voice) VALUES (?, ?)", (course, voice))
+    return cur.rowcount > 0
+
+# 動画のQ&Aを作成順に取得する（idx_qg_video_createdat を使う）
+def list_qna(video_id):
+    with transaction() as conn:
+        return conn.execute("""
+            SELECT qg.qgid, qg.videoId, qg.question, qg.explain, qg.model, qg.priority, qg.chunk_index, segment.voice, qg.createdat
+            FROM qg LEFT JOIN segment ON segment.id = qg.segment_id
+            WHERE qg.videoId = ?
+            ORDER BY qg.createdat ASC
+        """, (video_id,)).fetchall()
+
+
+# 重複除去用に質問を取得する（videoId または course で絞り込み、作成順）
+def list_questions(video_id=None, course=None):
+    if video_id is None and course is None:
+        raise ValueError("video_id か course を指定してください")
+    column, value = ("videoId", video_id) if video_id is not None else ("course", course)
+    with transaction() as conn:
+        return conn.execute(f"""
+            SELECT qgid, question, priority FROM qg WHERE {column} = ? ORDER BY createdat, qgid
+        """, (value,)).fetchall()
+
+# qgid を指定して削除し、削除件数を返す
+def delete_qna(qgids):
+    with transaction() as conn:
+        conn.executemany("DELETE FROM qg WHERE qgid = ?", [(qgid,) for qgid in qgids])
+        _remove_orphan_segments(conn)
+    return len(qgids)
+
+
+# 動画1本分のQ&Aを溜めておき、最後に1トランザクションで保存する
+# add() に chunk_index と指紋を渡したチャンクは、そのチャンクの以前のQ&Aを置き換えて指紋も更新する
+# （同じ質問の行は残して内容だけ更新し、新しい結果にない質問を削除する）
+class QnaBatch:
+    def __init__(self, video_id=None):
+        self.video_id = video_id
+        self.rows = []
+        self.fingerprints = {}
+
+    def add(self, rows, chunk_index=None, fingerprint=None):
+        self.rows.extend(rows)
+        if chunk_index is not None and fingerprint is not None:
+            self.fingerprints[chunk_index] = fingerprint
+
+    def commit(self):
+        now = datetime.utcnow().isoformat()
+        # 指紋を渡したチャンクの新しい質問（question_hash）
+        hashes = {idx: set() for idx in self.fingerprints}
+        for row in self.rows:
+            if row[9] in hashes:
+                hashes[row[9]].add(row[11])
+        with transaction() as conn:
+            # 同じ質問は upsert で更新し（qgid・createdat はそのまま）、新しい結果にない質問だけを削除する
+            if self.rows:
+                _insert_qna_rows(conn, self.rows)
+            for idx, keep in hashes.items():
+                keep = sorted(keep)
+                conn.execute(f"""
+                    DELETE FROM qg WHERE videoId = ? AND chunk_index = ? AND question_hash NOT IN ({",".join("?" * len(keep))})
+                """, [self.video_id, idx] + keep)
+            conn.executemany("""
+                INSERT INTO qg_fingerprint (videoId, chunk_index, fingerprint, updatedat) VALUES (?, ?, ?, ?)
+                ON CONFLICT (videoId, chunk_index) DO UPDATE SET fingerprint = excluded.fingerprint, updatedat = excluded.updatedat
+            """, [(self.video_id, idx, fp, now) for idx, fp in self.fingerprints.items()])
+            # 置き換えで使われなくなった文字起こし（内容が変わったスライドの以前の文字起こし）を消す
+            if self.fingerprints:
+                _remove_orphan_segments(conn)
+        count = len(self.rows)
+        self.rows = []
+        self.fingerprints = {}
+        return count
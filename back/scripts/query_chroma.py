@@ -1,34 +1,36 @@
-from chromadb import PersistentClient
-import sys
 import os
-from sentence_transformers import SentenceTransformer
+import argparse
 
 os.environ["CHROMA_TELEMETRY_ENABLED"] = "false"
 
-# クエリ文を引数から取得
-query = sys.argv[1]
-
-# ChromaのDBパス
-CHROMA_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../src/chroma_db"))
-client = PersistentClient(path=CHROMA_PATH)
-collection = client.get_or_create_collection("video-transcripts")
-
-print("ドキュメント数:", len(collection.get()["ids"]))
-
-# 🔽 ここで ruri-small を使ってクエリをベクトル化
-embedding_model = SentenceTransformer("cl-nagoya/ruri-small", trust_remote_code=True)
-query_embedding = embedding_model.encode([query]).tolist()
-
-# 🔽 query_embeddings を使う
-result = collection.query(
-    query_embeddings=query_embedding,
-    n_results=5
-)
-
-# 🔽 結果の表示
-print("検索結果:")
-for i, doc in enumerate(result["documents"][0]):
-    print(f"#{i+1}: {doc}")
-    print(f"  OCR: {result['metadatas'][0][i].get('ocr', '')}")
-    print(f"  start-end: {result['metadatas'][0][i]['start']} ～ {result['metadatas'][0][i]['end']}")
-
+from retrieval import Retriever, MODES
+
+# スライドの検索（既定はベクトル検索とBM25を統合したハイブリッド検索）
+# クエリを複数渡すと、まとめて埋め込み・検索する
+# 使い方: python query_chroma.py <クエリ> [<クエリ> ...] [--mode hybrid|dense|lexical] [-n 5] [--course ...] [--section ...] [--video-id ...]
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("queries", nargs="+")
+    parser.add_argument("--mode", choices=MODES, default="hybrid")
+    parser.add_argument("-n", "--n-results", type=int, default=5)
+    parser.add_argument("--course")
+    parser.add_argument("--section")
+    parser.add_argument("--video-id")
+    args = parser.parse_args()
+
+    retriever = Retriever()
+    print("ドキュメント数:", retriever.collection.count())
+
+    batch = retriever.search_batch(args.queries, mode=args.mode, n_results=args.n_results,
+                                   course=args.course, section=args.section, video_id=args.video_id)
+
+    # 🔽 結果の表示
+    for query, results in zip(args.queries, batch):
+        print(f"検索結果（{args.mode}）: {query}")
+        for i, r in enumerate(results):
+            print(f"#{i+1}: {r['document']}")
+            print(f"  OCR: {r['metadata'].get('ocr', '')}")
+            print(f"  start-end: {r['metadata']['start']} ～ {r['metadata']['end']}  score: {r['score']:.4f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import os
+import sys
+import numpy as np
+import qg_store
+from embedding import get_encoder, EMBED_MODEL, EMBED_ENGINE
+
+# 生成後の質問の重複除去
+# priority の高い順に質問を見ていき、既に残した質問のどれとも類似度が閾値未満のものだけを残す（貪欲法）
+# 似た組を連結成分でまとめると、A≒B≒C のように少しずつ違う質問が連鎖して1つにされてしまうため、残した質問との比較だけで決める
+# BLOCK_SIZE 件ずつ、残した質問との類似度を行列積でまとめて求め、ブロック内は小さな類似度行列で順に決める
+DEDUP_THRESHOLD = float(os.environ.get("QG_DEDUP_THRESHOLD", 0.95))
+BLOCK_SIZE = 512  # 一度に比べる質問の数（メモリは BLOCK_SIZE×残した質問数）
+
+# 残す質問の番号を返す（priority が同じなら先に並んでいるものを優先）
+def greedy_keep(embeddings, priorities, threshold=DEDUP_THRESHOLD, block_size=BLOCK_SIZE):
+    x = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    order = np.lexsort((np.arange(len(x)), -np.asarray(priorities, dtype=float)))
+    kept = np.zeros(0, dtype=np.int64)
+    for start in range(0, len(order), block_size):
+        block = order[start:start + block_size]
+        xb = x[block]
+        # 前のブロックまでに残した質問と似ているものを除く
+        alive = np.ones(len(block), dtype=bool)
+        if len(kept):
+            alive = (xb @ x[kept].T).max(axis=1) < threshold
+        # ブロック内は priority 順に、残すと決めた質問と似ているものを除いていく
+        sims = xb @ xb.T
+        chosen = []
+        for k in range(len(block)):
+            if alive[k]:
+                chosen.append(k)
+                alive &= sims[k] < threshold
+        kept = np.concatenate([kept, block[chosen]])
+    return np.sort(kept)
+
+# 質問のリストから、残す質問の番号と削除する質問の番号を返す
+def dedup(questions, priorities, encoder, threshold=DEDUP_THRESHOLD):
+    if len(questions) < 2:
+        return np.arange(len(questions)), np.zeros(0, dtype=np.int64)
+    embeddings = encoder.encode(questions, batch_size=64)
+    keep = greedy_keep(embeddings, priorities, threshold)
+    drop = np.setdiff1d(np.arange(len(questions)), keep)
+    return keep, drop
+
+# qg テーブルの質問を動画（または講義）単位で重複除去し、削除件数を返す
+def dedup_stored(video_id=None, course=None, encoder=None, threshold=DEDUP_THRESHOLD):
+    rows = qg_store.list_questions(video_id=video_id, course=course)
+    if len(rows) < 2:
+        return 0
+    encoder = encoder or get_encoder(EMBED_MODEL, EMBED_ENGINE)
+    qgids = [r[0] for r in rows]
+    _, drop = dedup([r[1] for r in rows], [r[2] for r in rows], encoder, threshold)
+    return qg_store.delete_qna([qgids[k] for k in drop])
+
+# 使い方: python question_dedup.py <videoId>
+#         python question_dedup.py --course <講義名>（講義内の全動画をまとめて重複除去）
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "--course":
+        removed = dedup_stored(course=sys.argv[2])
+    else:
+        removed = dedup_stored(video_id=sys.argv[1])
+    print(f"重複した質問を {removed}件 削除しました（閾値 {DEDUP_THRESHOLD}）")
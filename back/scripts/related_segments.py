@@ -0,0 +1,32 @@
+import os
+import sys
+import json
+from contextlib import redirect_stdout
+
+os.environ["CHROMA_TELEMETRY_ENABLED"] = "false"
+
+from retrieval import Retriever
+
+# 質問ごとの関連スライドをまとめて返す（Nodeサーバの POST /related から呼ぶ）
+# 標準入力: {"queries": [...], "mode": "hybrid", "n_results": 3, "course": ..., "section": ..., "video_id": ...}
+# 標準出力: {"results": [[{"id", "score", "document", "metadata"}, ...], ...]}（queries と同じ順）
+def main():
+    request = json.load(sys.stdin)
+    queries = request.get("queries") or []
+    if not isinstance(queries, list) or not all(isinstance(q, str) for q in queries):
+        raise ValueError("queries は文字列のリストにしてください")
+
+    # 途中の表示は標準エラーへ（標準出力はJSONだけにする）
+    with redirect_stdout(sys.stderr):
+        results = Retriever().search_batch(
+            queries,
+            mode=request.get("mode", "hybrid"),
+            n_results=int(request.get("n_results", 3)),
+            course=request.get("course"),
+            section=request.get("section"),
+            video_id=request.get("video_id")
+        )
+    json.dump({"results": results}, sys.stdout, ensure_ascii=False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import os
+from chromadb import PersistentClient
+from embedding import get_encoder, EMBED_MODEL, EMBED_ENGINE
+from lexical_index import LexicalIndex, LEXICAL_DB_PATH
+
+# スライド（文字起こし）の検索
+#   dense  : 埋め込みによるベクトル検索（Chroma）
+#   lexical: MeCabの語によるBM25検索（LexicalIndex）
+#   hybrid : 両方の順位を Reciprocal Rank Fusion で統合
+# course / section / video_id で絞り込める（Chromaでは where、BM25ではSQLの条件として渡す）
+CHROMA_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../src/chroma_db"))
+MODES = ("hybrid", "dense", "lexical")
+RRF_K = 60  # RRFの定数（大きいほど下位の順位も効く）
+CANDIDATES = 50  # 統合前にそれぞれから取る候補数
+
+# 指定された絞り込み条件だけの辞書
+def make_filters(course=None, section=None, video_id=None):
+    return {k: v for k, v in (("course", course), ("section", section), ("video_id", video_id)) if v is not None}
+
+# Chromaの where 句（条件が2つ以上なら $and でまとめる）
+def build_where(filters):
+    if not filters:
+        return None
+    if len(filters) == 1:
+        return dict(filters)
+    return {"$and": [{k: v} for k, v in filters.items()]}
+
+# 複数の順位付け（IDのリスト）を RRF で統合し、(ID, スコア) をスコア順に返す
+def rrf(rankings, k=RRF_K):
+    scores = {}
+    for ranking in rankings:
+        for rank, id_ in enumerate(ranking, 1):
+            scores[id_] = scores.get(id_, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class Retriever:
+    def __init__(self, chroma_path=CHROMA_PATH, lexical_path=LEXICAL_DB_PATH):
+        self.collection = PersistentClient(path=chroma_path).get_or_create_collection("video-transcripts")
+        self.lexical = LexicalIndex(lexical_path)
+        self._encoder = None
+        # インデックス導入前に登録した動画などで件数が合わないか、分かち書きの方法が変わっていれば、Chromaと同期してから使う
+        if self.lexical.needs_sync(self.collection):
+            updated, removed = self.lexical.sync(self.collection)
+            print(f"[INFO] 全文検索インデックスを同期しました（更新 {updated}件  削除 {removed}件）")
+
+    # 埋め込みモデルは dense / hybrid で初めて必要になったときに用意する
+    @property
+    def encoder(self):
+        if self._encoder is None:
+            self._encoder = get_encoder(EMBED_MODEL, EMBED_ENGINE)
+        return self._encoder
+
+    # 全クエリを1回で埋め込み、1回の複数クエリ検索で各クエリの上位IDを得る
+    def dense_ids(self, queries, n_results, filters):
+        embeddings = self.encoder.encode(queries, cache=True).tolist()
+        result = self.collection.query(query_embeddings=embeddings, n_results=n_results,
+                                       where=build_where(filters), include=["distances"])
+        return result["ids"]
+
+    def lexical_ids(self, queries, n_results, filters):
+        return [[id_ for id_, _ in self.lexical.search(query, n_results, filters)] for query in queries]
+
+    def search(self, query, mode="hybrid", n_results=5, course=None, section=None, video_id=None):
+        return self.search_batch([query], mode, n_results, course, section, video_id)[0]
+
+    # 複数クエリをまとめて検索する（質問ごとの関連スライドをページ単位で引く用途）
+    # 戻り値: クエリごとの [{"id", "score", "document", "metadata"}, ...]（関連が高い順）
+    def search_batch(self, queries, mode="hybrid", n_results=5, course=None, section=None, video_id=None):
+        if mode not in MODES:
+            raise ValueError(f"未対応の検索モード: {mode}（{' / '.join(MODES)}）")
+        queries = list(queries)
+        if not queries:
+            return []
+        filters = make_filters(course, section, video_id)
+        rankings = [[] for _ in queries]
+        if mode in ("hybrid", "dense"):
+            for ranking, ids in zip(rankings, self.dense_ids(queries, n_results if mode == "dense" else CANDIDATES, filters)):
+                ranking.append(ids)
+        if mode in ("hybrid", "lexical"):
+            for ranking, ids in zip(rankings, self.lexical_ids(queries, n_results if mode == "lexical" else CANDIDATES, filters)):
+                ranking.append(ids)
+        ranked = [rrf(r)[:n_results] for r in rankings]
+
+        # 全クエリの結果に出てきたスライドを1回で取得する
+        wanted = list(dict.fromkeys(id_ for r in ranked for id_, _ in r))
+        if not wanted:
+            return [[] for _ in queries]
+        found = self.collection.get(ids=wanted, include=["documents", "metadatas"])
+        by_id = {id_: (doc, meta) for id_, doc, meta in zip(found["ids"], found["documents"], found["metadatas"])}
+        return [[{"id": id_, "score": score, "document": by_id[id_][0], "metadata": by_id[id_][1]}
+                 for id_, score in r if id_ in by_id] for r in ranked]
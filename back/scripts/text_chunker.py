@@ -0,0 +1,114 @@
+import re
+
+# 文字起こしをトークン数で分割する
+# 対象モデルのトークナイザで数え、日本語の文末（。！？）とスライド（セグメント）の境目で切る
+# 隣り合うチャンクは overlap_tokens 分だけ文を重ねる
+
+# Ollamaのモデル名 → トークン数を数えるためのHugging Faceのトークナイザ
+TOKENIZERS = {
+    "qwen3:32b": "Qwen/Qwen3-32B",
+    "qwen3:14b": "Qwen/Qwen3-14B",
+    "qwen3:8b": "Qwen/Qwen3-8B",
+}
+
+SENTENCE_END = re.compile(r"(?<=[。！？!?])")
+
+# トークン数を数える関数を返す
+# トークナイザが読めない環境では1文字=1トークンとして数える（日本語では多めに見積もるので溢れない）
+def load_token_counter(model_name):
+    try:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(TOKENIZERS.get(model_name, model_name))
+        return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+    except Exception as e:
+        print(f"[WARN] {model_name} のトークナイザを読み込めないため文字数で見積もります: {e}")
+        return len
+
+# 1チャンクに入れてよい文字起こしのトークン数
+def chunk_budget(context_window, prompt_tokens, max_output_tokens, margin=0.05):
+    return int((context_window - prompt_tokens - max_output_tokens) * (1 - margin))
+
+# 文末で分割（文末記号は前の文に残す）
+def split_sentences(text):
+    return [s for s in SENTENCE_END.split(text) if s.strip()]
+
+# 1文だけで上限を超える場合は空白、それでも超えるなら文字数で刻む
+def _split_long(sentence, count_tokens, max_tokens):
+    pieces = []
+    current = ""
+    for word in re.split(r"(?<=\s)", sentence):
+        if current and count_tokens(current + word) > max_tokens:
+            pieces.append(current)
+            current = ""
+        while count_tokens(word) > max_tokens:
+            # 何文字で上限に収まるかを二分探索
+            lo, hi = 1, len(word)
+            while lo < hi:
+                mid = (lo + hi + 1) // 2
+                if count_tokens(word[:mid]) <= max_tokens:
+                    lo = mid
+                else:
+                    hi = mid - 1
+            pieces.append(word[:lo])
+            word = word[lo:]
+        current += word
+    if current:
+        pieces.append(current)
+    return pieces
+
+# segments: スライド（またはタイムスタンプ行）ごとの文字列のリスト
+# 戻り値: max_tokens 以下のチャンク文字列のリスト
+def chunk_segments(segments, count_tokens, max_tokens, overlap_tokens=0):
+    # (文, トークン数, セグメントの最後の文か) の列にする
+    units = []
+    for segment in segments:
+        sentences = []
+        for sentence in split_sentences(segment.strip()):
+            if count_tokens(sentence) + 1 > max_tokens:
+                sentences.extend(_split_long(sentence, count_tokens, max_tokens - 1))
+            else:
+                sentences.append(sentence)
+        for k, sentence in enumerate(sentences):
+            is_last = k == len(sentences) - 1
+            # セグメント末尾の文は連結時の改行も1トークンとして数える
+            units.append((sentence, count_tokens(sentence) + int(is_last), is_last))
+
+    chunks = []
+    start = 0
+    prev_end = 0  # 直前のチャンクの終わり（重ねた文だけのチャンクを作らないよう、必ずこれより先まで進める）
+    while start < len(units):
+        # 上限まで文を詰める
+        end = start
+        total = 0
+        while end < len(units) and total + units[end][1] <= max_tokens:
+            total += units[end][1]
+            end += 1
+        end = max(end, start + 1)
+
+        # 途中で切れる場合、半分以上埋まっていればセグメントの境目まで戻して切る（直前のチャンクの終わりより前には戻さない）
+        if end < len(units) and not units[end - 1][2]:
+            filled = total
+            for k in range(end - 1, max(start, prev_end), -1):
+                filled -= units[k][1]
+                if units[k - 1][2] and filled >= max_tokens // 2:
+                    end = k
+                    break
+        chunks.append(_join(units[start:end]))
+        if end >= len(units):
+            break
+
+        # 次のチャンクの先頭に、直前の文を overlap_tokens 分だけ重ねる
+        # 重ねた文と次の新しい文が max_tokens に収まらない分は重ねない
+        next_start = end
+        overlap = 0
+        while (next_start - 1 > start and overlap + units[next_start - 1][1] <= overlap_tokens
+               and overlap + units[next_start - 1][1] + units[end][1] <= max_tokens):
+            next_start -= 1
+            overlap += units[next_start][1]
+        prev_end = end
+        start = next_start
+    return chunks
+
+# セグメントの境目は改行、それ以外はそのまま連結
+def _join(units):
+    return "".join(sentence + ("\n" if is_last else "") for sentence, _, is_last in units).strip()
@@ -0,0 +1,91 @@
+import subprocess
+import numpy as np
+
+SAMPLE_RATE = 16000  # Whisperの推奨サンプリングレート
+
+# 動画長取得
+def get_duration(video_path):
+    out = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", video_path],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT
+    )
+    return float(out.stdout.decode().strip())
+
+# 映像の幅・高さ取得
+def get_frame_size(video_path):
+    out = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "stream=width,height", "-of", "csv=s=x:p=0", video_path],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT
+    )
+    width, height = out.stdout.decode().strip().splitlines()[0].split("x")
+    return int(width), int(height)
+
+# 動画を1回だけデコードし、interval秒ごとのフレームを (t, グレースケール画像) で返す
+# ffmpegのfpsフィルタで間引いたrawvideoをパイプで受け取るため、フレームごとのプロセス起動・シークが不要
+def iter_frames(video_path, interval, duration=None):
+    width, height = get_frame_size(video_path)
+    frame_bytes = width * height
+    command = [
+        "ffmpeg", "-v", "error", "-i", video_path,
+        "-an",  # 音声無視
+        # round=up: n枚目は n*interval 秒以降の最初のフレーム（既定の near では最大 interval/2 秒前のフレームになる）
+        "-vf", f"fps=1/{interval}:round=up,scale={width}:{height},format=gray",
+        "-f", "rawvideo", "pipe:1"
+    ]
+    proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=frame_bytes)
+    # 従来の range(0, int(duration), interval) と同じ時刻までに揃える
+    limit = int(duration) if duration is not None else None
+    try:
+        n = 0
+        while True:
+            t = n * interval
+            if limit is not None and t >= limit:
+                break
+            buf = proc.stdout.read(frame_bytes)
+            if len(buf) < frame_bytes:
+                break
+            yield t, np.frombuffer(buf, dtype=np.uint8).reshape(height, width)
+            n += 1
+    finally:
+        proc.stdout.close()
+        proc.kill()
+        proc.wait()
+
+# 動画から音声を1回だけデコードし、16kHzモノラルfloat32の配列で返す
+# スライドごとの音声は audio[int(start * sr):int(end * sr)] のスライス（コピーなし）で渡せる
+def load_audio(video_path, sr=SAMPLE_RATE):
+    out = subprocess.run(
+        ["ffmpeg", "-v", "error", "-i", video_path, "-vn", "-ac", "1", "-ar", str(sr), "-f", "f32le", "pipe:1"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        check=True
+    )
+    return np.frombuffer(out.stdout, dtype=np.float32)
+
+# 差分判定用にフレームをブロック平均で縮小（幅 約size ピクセル）
+def downscale(frame, size=64):
+    height, width = frame.shape
+    step = max(1, width // size)
+    h, w = height // step * step, width // step * step
+    blocks = frame[:h, :w].reshape(h // step, step, w // step, step)
+    return blocks.mean(axis=(1, 3), dtype=np.float32)
+
+# 縮小フレーム同士の平均絶対差（0〜255）
+def frame_diff(prev_small, small):
+    return float(np.abs(small - prev_small).mean())
+
+# 差分フィルタ：直前に通したフレームから見た目が変わっていないフレームは None に置き換えて返す
+# stats に total（全フレーム数）と skipped（省略したフレーム数）を記録する（threshold=0で無効）
+def iter_changed_frames(frames, threshold, stats):
+    ref_small = None
+    for t, frame in frames:
+        stats["total"] += 1
+        small = downscale(frame)
+        if ref_small is not None and frame_diff(ref_small, small) < threshold:
+            stats["skipped"] += 1
+            yield t, None
+            continue
+        ref_small = small
+        yield t, frame
@@ -2,7 +2,7 @@ const express = require("express");
 const multer = require("multer");
 const fs = require("fs");
 const path = require("path");
-const { execFile } = require("child_process");
+const { execFile, spawn } = require("child_process");
 const cors = require("cors");
 
 const app = express();
@@ -24,6 +24,21 @@ const storage = multer.diskStorage({
 
 const upload = multer({ storage });
 
+const pythonPath = path.join(__dirname, "../../venv/bin/python");
+const jobQueuePath = path.join(__dirname, "../scripts/job_queue.py");
+const workerPath = path.join(__dirname, "../scripts/ingest_worker.py");
+const relatedPath = path.join(__dirname, "../scripts/related_segments.py");
+const INGEST_WORKERS = process.env.INGEST_WORKERS || "2";
+
+// 動画取り込みワーカーを常駐させる（モデルを読み込んだまま待ち行列のジョブを順に処理）
+function startIngestWorkers() {
+  const worker = spawn(pythonPath, [workerPath, INGEST_WORKERS], { stdio: "inherit" });
+  worker.on("exit", (code) => {
+    console.error(`取り込みワーカーが終了しました (code=${code})。5秒後に再起動します`);
+    setTimeout(startIngestWorkers, 5000);
+  });
+}
+
 
 app.get("/tch", (req,res) =>{
   const htmlPath = path.join(__dirname, "../../front/tch/tch-index.html");
@@ -53,15 +68,13 @@ app.get("/tch", (req,res) =>{
 app.post("/uploads", upload.single("video"), (req, res) => {
   if (!req.file) return res.status(400).json({ error: "動画ファイルが必要です" });
 
-  const videoPath = req.file.path;
+  // ワーカーは別プロセスなので絶対パスで渡す（処理完了後にワーカーが削除する）
+  const videoPath = path.resolve(req.file.path);
   const { course, section, title, videoId } = req.body;
   const videoName = title || path.parse(req.file.originalname).name;
-  const scriptPath = path.join(__dirname, "../scripts/process_video.py");
-  
+
   //ocr無しで音声認識をする場合　比較用
   //const scriptPath = path.join(__dirname, "../scripts/asr_no_prompt.py");
-  
-  const pythonPath = path.join(__dirname, "../../venv/bin/python");
 
   console.log("受け取ったメタ情報:");
   console.log("コース:", course);
@@ -69,20 +82,51 @@ app.post("/uploads", upload.single("video"), (req, res) => {
   console.log("動画名:", title);
   console.log("動画ID:", videoId);
 
-  // Pythonスクリプトに必要ならメタ情報を渡す
-  const args = [scriptPath, videoPath, videoName, course, section, videoId];
+  // 処理の完了は待たず、ジョブとして登録してすぐにジョブIDを返す
+  const args = [jobQueuePath, "enqueue", videoPath, videoName, course, section, videoId];
 
   execFile(pythonPath, args, (err, stdout, stderr) => {
-    fs.unlinkSync(videoPath); // 一時ファイル削除
     if (err) {
       console.error(stderr);
-      return res.status(500).json({ error: "動画処理失敗", stderr });
+      fs.unlinkSync(videoPath);
+      return res.status(500).json({ error: "ジョブ登録失敗", stderr });
+    }
+    const { jobId } = JSON.parse(stdout);
+    res.status(202).json({ message: "処理を受け付けました", jobId });
+  });
+});
+
+// ジョブの状態（status: queued / running / done / failed、stage・done・total で段階ごとの進捗）
+app.get("/jobs/:id", (req, res) => {
+  execFile(pythonPath, [jobQueuePath, "status", req.params.id], (err, stdout, stderr) => {
+    if (err) {
+      console.error(stderr);
+      return res.status(500).json({ error: "ジョブ状態の取得失敗", stderr });
+    }
+    const job = JSON.parse(stdout);
+    if (!job) return res.status(404).json({ error: "ジョブが見つかりません" });
+    res.json(job);
+  });
+});
+
+// 質問ごとの関連スライド（body: { queries: [...], mode, n_results, course, section, video_id }）
+// 1ページ分の質問をまとめて渡すと、埋め込みとChroma検索がそれぞれ1回で済む
+app.post("/related", (req, res) => {
+  if (!Array.isArray(req.body.queries)) {
+    return res.status(400).json({ error: "queries は配列で指定してください" });
+  }
+  const child = execFile(pythonPath, [relatedPath], { maxBuffer: 32 * 1024 * 1024 }, (err, stdout, stderr) => {
+    if (err) {
+      console.error(stderr);
+      return res.status(500).json({ error: "関連スライドの検索失敗", stderr });
     }
-    res.json({ message: "処理完了", output: stdout.trim() });
+    res.json(JSON.parse(stdout));
   });
+  child.stdin.end(JSON.stringify(req.body));
 });
 
 app.listen(3001, () => {
   console.log("Server running at http://localhost:3001");
+  startIngestWorkers();
 });
 